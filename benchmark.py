@@ -0,0 +1,394 @@
+import argparse
+import datetime
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+
+# the files that worker processes import, checked by the startup benchmark
+STARTUP_MODULES = ["module", "freq_stats", "power", "sweep", "data_analysis", "profiling", "glow", "inference", "store",
+                   "resample", "plotting"]
+
+# heavy packages that should only be imported when they are actually used
+HEAVY_MODULES = ["scipy.stats", "pandas", "matplotlib", "pylab"]
+
+# the values each benchmark is run at (the first value of each is used with --quick)
+SIZES = [1000, 100000, 1000000]
+HOURS = [1, 0.1]
+WELLS = [24, 96, 384]
+
+# the file where "python benchmark.py suite --save" stores the timings that --check compares against
+BASELINE = "benchmark_baseline.json"
+
+
+def import_time(name, repeat=5):
+    """ Measure how long a fresh Python process takes to import a module, using python -X importtime.
+
+    Parameters
+    ----------
+    name : a string
+        The name of the module to import (e.g. "module").
+    repeat : an int (default value = 5)
+        The number of fresh processes to time. The fastest is kept, since the others only add noise.
+
+    Returns
+    -------
+    seconds : a float
+        The cumulative import time of the module, including everything it imports.
+    """
+
+    folder = os.path.dirname(os.path.abspath(__file__))
+    best = float("inf")
+
+    for i in range(repeat):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + name],
+                                cwd=folder, capture_output=True, text=True, check=True)
+        # each line looks like "import time:  self [us] | cumulative | name"
+        for line in result.stderr.splitlines():
+            parts = line.split("|")
+            if len(parts) == 3 and parts[2].strip() == name:
+                best = min(best, int(parts[1])/1e6)
+
+    return best
+
+
+def loaded_modules(name):
+    """ List the heavy packages that are loaded as a side effect of importing a module.
+
+    Parameters
+    ----------
+    name : a string
+        The name of the module to import (e.g. "module").
+
+    Returns
+    -------
+    heavy : a list of strings
+        The packages from HEAVY_MODULES that were imported.
+    """
+
+    folder = os.path.dirname(os.path.abspath(__file__))
+    code = "import sys, " + name + "; print(' '.join(m for m in " + repr(HEAVY_MODULES) + " if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], cwd=folder, capture_output=True, text=True, check=True)
+
+    return result.stdout.split()
+
+
+def startup_benchmark(modules=STARTUP_MODULES, target=0.5, repeat=5):
+    """ Time the cold start import of each module and check it against a target.
+
+    Parameters
+    ----------
+    modules : a list of strings (default value = STARTUP_MODULES)
+        The names of the modules to time.
+    target : a float (default value = 0.5)
+        The most seconds a fresh worker process may spend importing a module.
+    repeat : an int (default value = 5)
+        The number of fresh processes to time for each module.
+
+    Returns
+    -------
+    times : a dictionary
+        The import time in seconds of each module.
+    passed : a boolean
+        True if every module imports in less than target seconds.
+    """
+
+    times = {name: import_time(name, repeat) for name in modules}
+
+    return times, all(i < target for i in times.values())
+
+
+def write_synthetic_experiment(folder, exp, wells, times=30, seed=0):
+    """ Write a made-up experiment in the same Excel format as the lab data, so no real data is needed.
+
+    Parameters
+    ----------
+    folder : a string
+        The folder to write "<exp>_data.xlsx" and "<exp>_setup.xlsx" to.
+    exp : a string (e.g. "exp_1")
+        The first part of the file names.
+    wells : an int
+        The number of wells, labelled like a plate (A1, A2, ... then B1, ...) with 24 wells per row.
+    times : an int (default value = 30)
+        The number of counts, every half hour from 9:00.
+    seed : an int (default value = 0)
+        The seed used to make up the counts.
+    """
+    import pandas as pd
+    from glow import plate_labels
+
+    rng = np.random.default_rng(seed)
+    labels = plate_labels(wells)
+    worm_num = rng.integers(20, 40, wells)
+    e_coli = rng.integers(10, 100, wells)*10
+    # a bump of glowing worms in each well, centered at a time that depends on the food per worm
+    hours = np.arange(times)/2
+    center = 4 + 6*(1 - (e_coli/worm_num)/(e_coli/worm_num).max()) + rng.normal(0, 1, wells)
+    glowing = worm_num*0.4*np.exp(-(hours[:, None] - center)**2/4)
+    counts = rng.binomial(worm_num, np.clip(glowing/worm_num, 0, 1))
+
+    data = pd.DataFrame(counts, columns=labels)
+    data.insert(0, "time", [datetime.time(9 + i//2, 30*(i % 2)) for i in range(times)])
+    data.to_excel(os.path.join(folder, exp + "_data.xlsx"), index=False)
+    setup = pd.DataFrame({"well_num": labels, "worm_num": worm_num, "e_coli": e_coli})
+    setup.to_excel(os.path.join(folder, exp + "_setup.xlsx"), index=False)
+
+
+def _simulator_cases(quick):
+    # each case is (name, setup), where setup() returns the function to time
+    import module
+
+    sizes = SIZES[:1] if quick else SIZES
+    hours = HOURS[:1] if quick else HOURS
+    cases = []
+    for size in sizes:
+        def setup(size=size):
+            return lambda: module.create_groups(8, 1, size, rng=0)
+        cases.append(("create_groups[size=" + str(size) + "]", setup))
+
+        def setup(size=size):
+            worms = module.create_groups(8, 1, size, rng=0)
+            return lambda: module.find_molt(size, worms)
+        cases.append(("find_molt[size=" + str(size) + "]", setup))
+
+        def setup(size=size):
+            return lambda: module.simulate_analytic(0.1, 8, size, 1, rng=0)
+        cases.append(("simulate_analytic[size=" + str(size) + "]", setup))
+
+        def setup(size=size):
+            return lambda: module.simulate_stream(1, 8, size, 1, rng=0)
+        cases.append(("simulate_stream[size=" + str(size) + "]", setup))
+
+    for size, hour in itertools.product(sizes, hours):
+        name = "[size=" + str(size) + ",hour=" + str(hour) + "]"
+
+        def setup(size=size, hour=hour):
+            molt = module.find_molt(size, module.create_groups(8, 1, size, rng=0))
+            bins = module.create_bin(module.find_mid_bin(module.find_small(molt, hour), module.find_big(molt, hour), hour))
+            return lambda: [module.sort_worm(i, bins, molt) for i in range(4)]
+        cases.append(("sort_worm" + name, setup))
+
+        def setup(size=size, hour=hour):
+            molt = module.find_molt(size, module.create_groups(8, 1, size, rng=0))
+            mid_bin = module.find_mid_bin(module.find_small(molt, hour), module.find_big(molt, hour), hour)
+            sorted_worms = module.sort_worm(0, module.create_bin(mid_bin), molt)
+            return lambda: module.fix_data(sorted_worms, mid_bin)
+        cases.append(("fix_data" + name, setup))
+
+        def setup(size=size, hour=hour):
+            return lambda: module.simulate_run(hour, 8, size, 1, seed=0)
+        cases.append(("run" + name, setup))
+
+    for reps in ([100] if quick else [100, 10000]):
+        def setup(reps=reps):
+            return lambda: module.batch_p_values(1, 8, 50, 1, reps, rng=0)
+        cases.append(("batch_p_values[reps=" + str(reps) + ",size=50]", setup))
+
+    return cases
+
+
+def _analysis_cases(quick, folder):
+    # the lab data cases write their synthetic workbooks into folder
+    import data_analysis
+
+    cases = []
+    for wells in (WELLS[:1] if quick else WELLS):
+        exp = "exp_" + str(wells)
+        write_synthetic_experiment(folder, exp, wells)
+        name = "[wells=" + str(wells) + "]"
+
+        def setup(exp=exp):
+            cache = tempfile.mkdtemp(dir=folder)
+            # a new cache folder for every call, so the workbooks are parsed each time
+            return lambda: data_analysis.load_experiment(exp, folder, tempfile.mkdtemp(dir=cache))
+        cases.append(("load_experiment_excel" + name, setup))
+
+        def setup(exp=exp):
+            data_analysis.load_experiment(exp, folder)
+            return lambda: data_analysis.load_experiment(exp, folder)
+        cases.append(("load_experiment_cached" + name, setup))
+
+        def setup(exp=exp):
+            data, setup_table = data_analysis.load_experiment(exp, folder)
+            return lambda: data_analysis.find_wells(data, setup_table)
+        cases.append(("find_wells" + name, setup))
+
+        def setup(wells=wells):
+            import glow
+            means = np.random.default_rng(0).uniform(10, 20, wells)
+            return lambda: glow.glow_counts(np.linspace(0, 30, 300), means, 30, 8, rng=0)
+        cases.append(("glow_counts[times=300,wells=" + str(wells) + "]", setup))
+
+        def setup(exp=exp):
+            data, setup_table = data_analysis.load_experiment(exp, folder)
+            groups, conc, counts = data_analysis.find_wells(data, setup_table)[:3]
+            times = np.array(data["time"]) - data["time"][0]
+            return lambda: data_analysis.pair_table(groups, conc, times, counts)
+        cases.append(("pair_table" + name, setup))
+
+        def setup(exp=exp):
+            import io
+            from plotting import offscreen_figure
+            data_analysis.load_experiment(exp, folder)
+            def draw():
+                # the figure is rendered to memory too, since drawing is where the time goes
+                fig, ax = offscreen_figure()
+                data_analysis.make_graph(exp, folder, ax=ax)
+                fig.savefig(io.BytesIO(), format="png")
+            return draw
+        cases.append(("make_graph" + name, setup))
+
+    return cases
+
+
+def time_function(function, repeat=5, min_time=0.05):
+    """ Time a function the way timeit does: call it in loops long enough to measure, and keep the fastest loop.
+
+    Parameters
+    ----------
+    function : a function with no arguments
+        The code to time.
+    repeat : an int (default value = 5)
+        The number of loops to time.
+    min_time : a float (default value = 0.05)
+        Each loop calls the function enough times to take at least this many seconds.
+
+    Returns
+    -------
+    seconds : a float
+        The fastest time per call.
+    """
+
+    # find how many calls make a loop long enough to time
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(number):
+            function()
+        spent = time.perf_counter() - start
+        if spent >= min_time or number >= 1000:
+            break
+        number *= 10
+
+    best = spent/number
+    for i in range(repeat - 1):
+        start = time.perf_counter()
+        for j in range(number):
+            function()
+        best = min(best, (time.perf_counter() - start)/number)
+
+    return best
+
+
+def run_suite(match=None, quick=False, repeat=5):
+    """ Run the benchmarks of the simulator and lab analysis hot paths.
+
+    Parameters
+    ----------
+    match : a string or None (default value = None)
+        Only run the benchmarks whose name contains this text. None runs all of them.
+    quick : a boolean (default value = False)
+        If True, only run the smallest size, hour and well count.
+    repeat : an int (default value = 5)
+        The number of loops timed for each benchmark.
+
+    Returns
+    -------
+    times : a dictionary
+        The fastest time per call, in seconds, of each benchmark by name.
+    """
+
+    times = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for name, setup in _simulator_cases(quick) + _analysis_cases(quick, folder):
+            if match is None or match in name:
+                times[name] = time_function(setup(), repeat)
+
+    return times
+
+
+def compare(times, baseline, tolerance=0.25):
+    """ Find the benchmarks that became slower than the stored baseline.
+
+    Parameters
+    ----------
+    times : a dictionary
+        The new time of each benchmark, in seconds.
+    baseline : a dictionary
+        The stored time of each benchmark, in seconds. Benchmarks missing from it are not compared.
+    tolerance : a float (default value = 0.25)
+        How much slower (as a fraction) a benchmark can be before it counts as a slowdown.
+
+    Returns
+    -------
+    slower : a dictionary
+        The ratio of new time to baseline time of each benchmark that is too slow.
+    """
+
+    return {name: seconds/baseline[name] for name, seconds in times.items()
+            if name in baseline and seconds > baseline[name]*(1 + tolerance)}
+
+
+def main(argv=None):
+    """ Run the benchmarks from the command line. Returns 1 if a benchmark misses its target, so it can be used as a check.
+    e.g. python benchmark.py startup --target 0.5
+         python benchmark.py suite --save            (store this machine's timings as the baseline)
+         python benchmark.py suite --check           (fail if anything is more than 25% slower than the baseline)
+    """
+
+    parser = argparse.ArgumentParser(description="Benchmarks for the larval DR simulation and lab analysis.")
+    parser.add_argument("suite", choices=["startup", "suite"], help="the benchmark to run")
+    parser.add_argument("--target", type=float, default=0.5, help="startup: the most seconds allowed per import")
+    parser.add_argument("--repeat", type=int, default=5, help="the number of fresh processes or timed loops")
+    parser.add_argument("--match", default=None, help="suite: only run benchmarks whose name contains this text")
+    parser.add_argument("--quick", action="store_true", help="suite: only run the smallest parameter values")
+    parser.add_argument("--baseline", default=BASELINE, help="suite: the JSON file of stored timings")
+    parser.add_argument("--save", action="store_true", help="suite: store the timings as the new baseline")
+    parser.add_argument("--check", action="store_true", help="suite: fail if a benchmark is slower than the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="suite: the fraction slower allowed by --check")
+    args = parser.parse_args(argv)
+
+    if args.suite == "startup":
+        times, passed = startup_benchmark(target=args.target, repeat=args.repeat)
+        for name, seconds in times.items():
+            heavy = loaded_modules(name)
+            print(name.ljust(15), str(round(seconds*1000, 1)).rjust(8), "ms", " (loads " + ", ".join(heavy) + ")" if heavy else "")
+        print("passed" if passed else "FAILED: an import took more than " + str(args.target) + " s")
+        return 0 if passed else 1
+
+    times = run_suite(args.match, args.quick, args.repeat)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    for name, seconds in times.items():
+        line = name.ljust(50) + str(round(seconds*1000, 3)).rjust(12) + " ms"
+        if name in baseline:
+            line += "   x" + str(round(seconds/baseline[name], 2)) + " of baseline"
+        print(line)
+
+    if args.save:
+        # keep the stored timings of benchmarks that were not run this time
+        baseline.update(times)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print("saved", len(times), "timings to", args.baseline)
+
+    if args.check:
+        slower = compare(times, baseline, args.tolerance)
+        for name, ratio in slower.items():
+            print("SLOWER:", name, "is", round(ratio, 2), "times the baseline")
+        print("passed" if not slower else "FAILED: " + str(len(slower)) + " benchmarks are slower than the baseline")
+        return 1 if slower else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,18 +9,509 @@
 # the column called "worm_num" that is the total number of worms in each well,
 # and the column called "e_coli" that is the E. coli concentration in each well
 
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.lines as mlines
+# Data folder
+# both files are read from the folder passed in as data_dir (e.g. data_dir="D://Larval_DR/experiments")
+# pandas and matplotlib are only imported when a function runs, so importing this file is fast and has no side effects
+
+# Cache
+# the first time an experiment is loaded, both workbooks are parsed once and saved as a ".npz" file in cache_dir
+# the cache is used again until the modification time, size and content hash of either workbook change
+
+# Live experiments
+# while an experiment is running, LiveExperiment reads only the new rows of "exp_4_data.csv" (an append log with the
+# same columns as the data spreadsheet) or of the changed workbook, and keeps the curves and t tests up to date
+
+# Profiling
+# run any function inside profiling.profile to record the time and memory of each stage
+# (read_excel, load_cache, find_wells, t_tests and plot), e.g. "with profile() as record: stats_test(...)"
+
+# Resampling
+# stats_test(method="permutation") or method="bootstrap" finds each p value by resampling the counts of the two wells
+# instead of a t test, which does not assume the molt times are normal (see resample.py)
+
+import hashlib
+import json
 import os
 import numpy as np
-import pylab
-from scipy import stats
+from freq_stats import describe_counts, ttest_stats
+from profiling import stage
+from seeding import spawn_seeds
+
+
+def file_stamp(path, old=None):
+    """ Describe the current state of a file so a cache can tell whether it has changed.
+
+    Parameters
+    ----------
+    path : string
+        The location of the file.
+    old : a dictionary or None (default value = None)
+        The stamp saved in the cache. If only the modification time changed, the content hash is compared,
+        so a file that was saved again without changes does not need to be parsed again.
+
+    Returns
+    -------
+    stamp : a dictionary
+        The modification time ("mtime"), size ("size") and SHA-1 hash of the contents ("sha1") of the file.
+    """
+    info = os.stat(path)
+    stamp = {"mtime": info.st_mtime_ns, "size": info.st_size}
+    if old is not None and old["mtime"] == stamp["mtime"] and old["size"] == stamp["size"]:
+        # the file has not been touched, so the hash does not need to be read again
+        stamp["sha1"] = old["sha1"]
+        return stamp
+    
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(block)
+    stamp["sha1"] = sha1.hexdigest()
+    
+    return stamp
+
+
+def save_cache(path, arrays):
+    """ Save a dictionary of arrays as a ".npz" file, writing to a temporary file first
+    so an interrupted write never leaves a broken cache file.
+
+    Parameters
+    ----------
+    path : string
+        The location of the ".npz" file.
+    arrays : a dictionary of numpy arrays
+        The arrays to save, by name.
+    """
+    np.savez(path + ".tmp.npz", **arrays)
+    os.replace(path + ".tmp.npz", path)
+
+
+def clock_hours(values):
+    """ Convert the times in a "time" column to clock hours (e.g. 9:30am is 9.5).
+
+    Parameters
+    ----------
+    values : a list, numpy array or pandas Series
+        Times as datetime.time or datetime values, text (e.g. "9:30") or numbers that are already hours.
+
+    Returns
+    -------
+    hours : a numpy array of floats
+    """
+    
+    hours = []
+    for i in values:
+        if isinstance(i, str):
+            # times typed as text are parsed first (a number typed as text is already in hours)
+            try:
+                i = float(i)
+            except ValueError:
+                # pandas is only needed to parse times typed as text
+                import pandas as pd
+                i = pd.to_datetime(i)
+        hours.append(float(i) if isinstance(i, (int, float, np.number)) else i.hour + (i.minute/60))
+    
+    return np.array(hours, dtype=float)
+
+
+def load_experiment(exp, data_dir=".", cache_dir=None):
+    """ Read the data and setup information of an experiment, parsing the Excel files only when they have changed.
+
+    Parameters
+    ----------
+    exp : string (e.g. "exp_4" for experiment #4)
+        The first part of the file names for the data and setup information for that particular experiment.
+    data_dir : string (default value = ".")
+        The folder where the experimental data and setup data are stored.
+    cache_dir : string or None (default value = None)
+        The folder where parsed experiments are cached. None uses a folder called ".cache" inside data_dir.
+
+    Returns
+    -------
+    data : a pandas DataFrame
+        A column called "time" with the clock time of each count in hours (e.g. 9:30am is 9.5),
+        then one column of counts for each well.
+    setup : a pandas DataFrame
+        The columns "well_num", "worm_num" and "e_coli" from the setup file.
+    """
+    import pandas as pd
+    
+    if cache_dir is None:
+        cache_dir = os.path.join(data_dir, ".cache")
+    data_path = os.path.join(data_dir, exp + "_data.xlsx")
+    setup_path = os.path.join(data_dir, exp + "_setup.xlsx")
+    cache_path = os.path.join(cache_dir, exp + ".npz")
+    
+    # use the cache if both workbooks have the same contents as when it was written
+    cached = None
+    if os.path.exists(cache_path):
+        with stage("load_cache"):
+            with np.load(cache_path) as f:
+                cached = {key: f[key] for key in f.files}
+            old = json.loads(str(cached["stamps"]))
+            stamps = [file_stamp(data_path, old[0]), file_stamp(setup_path, old[1])]
+            if [i["sha1"] for i in stamps] != [i["sha1"] for i in old]:
+                cached = None
+            elif stamps != old:
+                # same contents with a new modification time, so only the stamps are updated
+                cached["stamps"] = np.array(json.dumps(stamps))
+                save_cache(cache_path, cached)
+    
+    if cached is None:
+        with stage("read_excel"):
+            stamps = [file_stamp(data_path), file_stamp(setup_path)]
+            raw = pd.read_excel(data_path)
+            raw_setup = pd.read_excel(setup_path)
+            # well labels can be numbers or strings, so they are saved as JSON to keep their type
+            wells = [i.item() if hasattr(i, "item") else i for i in raw.columns if i != "time"]
+            setup_wells = [i.item() if hasattr(i, "item") else i for i in raw_setup["well_num"]]
+            cached = {"time": clock_hours(raw["time"]),
+                      "wells": np.array(json.dumps(wells)),
+                      "counts": raw[wells].to_numpy(),
+                      "setup_wells": np.array(json.dumps(setup_wells)),
+                      "worm_num": raw_setup["worm_num"].to_numpy(),
+                      "e_coli": raw_setup["e_coli"].to_numpy(),
+                      "stamps": np.array(json.dumps(stamps))}
+            os.makedirs(cache_dir, exist_ok=True)
+            save_cache(cache_path, cached)
+    
+    wells = json.loads(str(cached["wells"]))
+    data = pd.DataFrame(cached["counts"], columns=wells)
+    data.insert(0, "time", cached["time"])
+    setup = pd.DataFrame({"well_num": json.loads(str(cached["setup_wells"])),
+                          "worm_num": cached["worm_num"], "e_coli": cached["e_coli"]})
+    
+    return data, setup
 
-# change directory to folder location where experimental data and setup data are stored
-os.chdir("D://Larval_DR/experiments")
 
-def make_graph(exp):
+def find_wells(data, setup):
+    """ Join the setup information to every well with data, all at once instead of well by well.
+
+    Parameters
+    ----------
+    data : a pandas DataFrame
+        A column called "time" and one column of counts for each well (from load_experiment).
+    setup : a pandas DataFrame
+        The columns "well_num", "worm_num" and "e_coli" (from load_experiment).
+
+    Returns
+    -------
+    groups : a numpy array
+        The labels of the wells that have at least one worm counted.
+    conc : a numpy array of floats
+        The amount of E. coli per worm in each well.
+    counts : a numpy array with shape (number of times, len(groups))
+        The number of worms glowing in each well at each time.
+    fraction : a numpy array of floats with shape (number of times, len(groups))
+        The fraction of worms molting in each well at each time.
+    """
+    # keep the wells that are not all zero
+    wells = data.drop(columns="time")
+    wells = wells.loc[:, (wells != 0).any(axis=0)]
+    groups = np.array(wells.columns)
+    counts = wells.to_numpy()
+    
+    # index the setup by well once, then line it up with the wells (a missing well raises a KeyError)
+    indexed = setup.set_index("well_num").loc[wells.columns]
+    # find the total number of worms per well (at least as many as were ever counted)
+    total = np.maximum(indexed["worm_num"].to_numpy().astype(int), counts.max(axis=0, initial=0))
+    # find the amount of E. coli per worm and the fraction of worms molting
+    conc = indexed["e_coli"].to_numpy().astype(int)/total
+    fraction = counts/total
+    
+    return groups, conc, counts, fraction
+
+
+def find_outliers(conc):
+    """ Find the wells whose concentration is an outlier (more than 1.5 times the interquartile range from the quartiles).
+
+    Parameters
+    ----------
+    conc : a numpy array of floats
+        The amount of E. coli per worm in each well.
+
+    Returns
+    -------
+    keep : a numpy array of booleans
+        False for the wells that are outliers.
+    """
+    Q3 = np.percentile(conc, 75)
+    Q1 = np.percentile(conc, 25)
+    high = Q3 + 1.5*(Q3 - Q1)
+    low = Q1 - 1.5*(Q3 - Q1)
+    
+    return ~((conc > high) | (conc < low))
+
+
+def pair_table(groups, conc, times, counts, equal_var=True, method="t", resamples=10000, seed=None):
+    """ Run a t test between every pair of wells at once, from the count, mean and variance of each well.
+
+    Parameters
+    ----------
+    groups : a numpy array
+        The labels of the wells.
+    conc : a numpy array of floats
+        The amount of E. coli per worm in each well.
+    times : a numpy array of floats
+        The time of each count in hours.
+    counts : a numpy array with shape (len(times), len(groups))
+        The number of worms glowing in each well at each time.
+    equal_var : a boolean (default value = True)
+        If True, run Student's t test. If False, run Welch's t test.
+    method : a string (default value = "t")
+        "t" for t tests, or "permutation" or "bootstrap" to find the p value of each t statistic by resampling
+        the counts of the two wells (see resample.resample_test).
+    resamples : an int (default value = 10000)
+        The number of resamples drawn for each pair when method is "permutation" or "bootstrap".
+    seed : None, an int, a numpy SeedSequence or a numpy Generator (default value = None)
+        The seed of the resamples.
+
+    Returns
+    -------
+    pairs : a pandas DataFrame
+        One row for each pair of wells (well_a listed before well_b in groups), with the columns
+        "well_a", "well_b", "d_conc" (conc of b minus a), "d_mean" (mean time of b minus a) and "p".
+        The p value is nan if either well has fewer than two worms counted.
+    """
+    # the sufficient statistics of each well, found once
+    n, mean, var = describe_counts(times, np.asarray(counts).T)
+    pairs = pair_stats(groups, conc, n, mean, var, equal_var)
+    
+    if method != "t":
+        # resampling is only loaded when it is asked for
+        from resample import resample_pairs
+        pairs["p"] = resample_pairs(groups, times, counts, pairs, method, resamples, seed, equal_var)
+    
+    return pairs
+
+
+def pair_stats(groups, conc, n, mean, var, equal_var=True):
+    """ Run a t test between every pair of wells at once, from the number, mean and variance of the times counted in each well.
+
+    Parameters
+    ----------
+    groups : a numpy array
+        The labels of the wells.
+    conc : a numpy array of floats
+        The amount of E. coli per worm in each well.
+    n, mean, var : numpy arrays of floats
+        The number of worms counted, and the mean and sample variance of their times, in each well.
+    equal_var : a boolean (default value = True)
+        If True, run Student's t test. If False, run Welch's t test.
+
+    Returns
+    -------
+    pairs : a pandas DataFrame
+        The same table as pair_table.
+    """
+    import pandas as pd
+    
+    # every pair of wells (a, b) with a before b, tested as one broadcast operation
+    a, b = np.triu_indices(len(groups), k=1)
+    p = ttest_stats(n[a], mean[a], var[a], n[b], mean[b], var[b], equal_var)[1]
+    p = np.where((n[a] > 1) & (n[b] > 1), p, np.nan)
+    
+    return pd.DataFrame({"well_a": groups[a], "well_b": groups[b], "d_conc": conc[b] - conc[a],
+                         "d_mean": mean[b] - mean[a], "p": p})
+
+
+def analyze_experiment(exp, data_dir=".", cache_dir=None, alpha=0.05, method="t", resamples=10000, seed=None):
+    """ Load one experiment and find the pairs of wells that are significantly different.
+
+    Parameters
+    ----------
+    exp : string (e.g. "exp_4" for experiment #4)
+        The first part of the file names for the data and setup information for that particular experiment.
+    data_dir : string (default value = ".")
+        The folder where the experimental data and setup data are stored.
+    cache_dir : string or None (default value = None)
+        The folder where parsed experiments are cached. None uses a folder called ".cache" inside data_dir.
+    alpha : a float (default value = 0.05)
+        The significance threshold for the p values.
+    method : a string (default value = "t")
+        "t", "permutation" or "bootstrap" (see pair_table).
+    resamples : an int (default value = 10000)
+        The number of resamples drawn for each pair when method is "permutation" or "bootstrap".
+    seed : None, an int, a numpy SeedSequence or a numpy Generator (default value = None)
+        The seed of the resamples.
+
+    Returns
+    -------
+    pairs : a pandas DataFrame
+        The rows of pair_table with a p value below alpha.
+    """
+    # read in the data and setup information
+    data, setup = load_experiment(exp, data_dir, cache_dir)
+    
+    # data manipulation: find the concentration per worm in every well
+    with stage("find_wells"):
+        groups, conc, counts = find_wells(data, setup)[:3]
+    
+    # find and remove any outliers based on concentration
+    keep = find_outliers(conc)
+    
+    # the distribution of times is kept as counts at each time, not repeated into lists
+    times = np.array(data["time"]) - data["time"][0]
+    
+    # run a pairwise t-test between all groups
+    with stage("t_tests"):
+        pairs = pair_table(groups[keep], conc[keep], times, counts[:, keep], method=method, resamples=resamples,
+                           seed=seed)
+    
+    return pairs[pairs["p"] < alpha].reset_index(drop=True)
+
+
+def find_quadrant(x, y):
+    """ Name the color of the quadrant each point is in.
+
+    Parameters
+    ----------
+    x : a numpy array of floats
+        The differences in concentrations per worm.
+    y : a numpy array of floats
+        The differences in average molting times.
+
+    Returns
+    -------
+    colors : a numpy array of strings
+        "green" if more food molts sooner (negative), "red" if more food molts later (positive), otherwise "orange" (neutral).
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    
+    return np.where((x > 0) & (y < 0), "green", np.where((x > 0) & (y > 0), "red", "orange"))
+
+
+class PairAggregator():
+    """ Keeps running totals of significant pairs, so any number of experiments can be combined in constant memory.
+    
+    Instance Attributes
+    -------------------
+    counts : a dictionary
+        The number of points in the "green", "red" and "orange" quadrants.
+    n, sx, sy, sxx, sxy : floats
+        The number of points and the running sums used to find the line of best fit.
+    x_min, x_max : floats
+        The smallest and largest x seen, so the line of best fit can be drawn across the points.
+    """
+    
+    def __init__(self):
+        self.counts = {"green": 0, "red": 0, "orange": 0}
+        self.n = 0
+        self.sx = 0.0
+        self.sy = 0.0
+        self.sxx = 0.0
+        self.sxy = 0.0
+        self.x_min = np.inf
+        self.x_max = -np.inf
+    
+    def add(self, x, y):
+        """ Add points to the running totals.
+        
+        Parameters
+        ----------
+        x : a numpy array of floats
+            The differences in concentrations per worm.
+        y : a numpy array of floats
+            The differences in average molting times.
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        colors, number = np.unique(find_quadrant(x, y), return_counts=True)
+        for color, k in zip(colors, number):
+            self.counts[str(color)] += int(k)
+        self.n += len(x)
+        self.sx += x.sum()
+        self.sy += y.sum()
+        self.sxx += (x*x).sum()
+        self.sxy += (x*y).sum()
+        if len(x):
+            self.x_min = min(self.x_min, x.min())
+            self.x_max = max(self.x_max, x.max())
+    
+    def fit(self):
+        """ Find the least-squares line of best fit through every point added so far (the same as np.polyfit with degree 1).
+        
+        Returns
+        -------
+        m : a float
+            The slope of the line (nan with fewer than two distinct x values).
+        b : a float
+            The intercept of the line.
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            m = (self.n*self.sxy - self.sx*self.sy)/(self.n*self.sxx - self.sx**2)
+            b = (self.sy - m*self.sx)/self.n
+        
+        return m, b
+
+
+def _analyze(args):
+    # unpack the arguments in the worker process and return the name of the experiment with its pairs
+    exp, data_dir, cache_dir, alpha, method, resamples, seed = args
+    return exp, analyze_experiment(exp, data_dir, cache_dir, alpha, method, resamples, seed)
+
+
+def analyze_archive(exp_list, data_dir=".", cache_dir=None, alpha=0.05, processes=None, callback=None, method="t",
+                    resamples=10000, seed=None):
+    """ Analyze many experiments at once in a pool of processes, folding each one into a PairAggregator as it finishes.
+
+    Parameters
+    ----------
+    exp_list : a list of strings
+        Lists the experiments on which to run statistical tests for differences between groups.
+    data_dir : string (default value = ".")
+        The folder where the experimental data and setup data are stored.
+    cache_dir : string or None (default value = None)
+        The folder where parsed experiments are cached. None uses a folder called ".cache" inside data_dir.
+    alpha : a float (default value = 0.05)
+        The significance threshold for the p values.
+    processes : None or an int (default value = None)
+        The number of worker processes. None uses every core, and 1 runs everything in this process.
+    callback : None or a function (default value = None)
+        Called as callback(exp, pairs) with the significant pairs of each experiment, in the order of exp_list,
+        before they are discarded (e.g. to plot them).
+    method : a string (default value = "t")
+        "t", "permutation" or "bootstrap" (see pair_table).
+    resamples : an int (default value = 10000)
+        The number of resamples drawn for each pair when method is "permutation" or "bootstrap".
+    seed : None, an int, a numpy SeedSequence or a numpy Generator (default value = None)
+        The seed of the resamples. Each experiment has its own child seed, so the results do not depend on processes.
+
+    Returns
+    -------
+    totals : an object of the class PairAggregator
+        The quadrant counts and line of best fit of every significant pair.
+    """
+    import multiprocessing
+    
+    totals = PairAggregator()
+    seeds = spawn_seeds(seed, len(exp_list))
+    tasks = [(exp, data_dir, cache_dir, alpha, method, resamples, child) for exp, child in zip(exp_list, seeds)]
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    
+    if processes == 1 or len(tasks) < 2:
+        results = map(_analyze, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(min(processes, len(tasks)))
+        results = pool.imap(_analyze, tasks)
+    
+    try:
+        # each experiment is added to the totals and then dropped, so memory does not grow with the archive
+        for exp, pairs in results:
+            totals.add(pairs["d_conc"], pairs["d_mean"])
+            if callback is not None:
+                callback(exp, pairs)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    
+    return totals
+
+
+def make_graph(exp, data_dir=".", cache_dir=None, ax=None):
     """ Create a graph that plots the fractions of each well glowing (i.e. worms molting) over time.
     The colors of each line are based on the concentration of E. coli per worm in each well.
 
@@ -28,33 +519,31 @@ def make_graph(exp):
     ----------
     exp : string (e.g. "exp_4" for experiment #4)
         The first part of the file names for the data and setup information for that particular experiment.
+    data_dir : string (default value = ".")
+        The folder where the experimental data and setup data are stored.
+    cache_dir : string or None (default value = None)
+        The folder where parsed experiments are cached. None uses a folder called ".cache" inside data_dir.
+    ax : None or a matplotlib Axes (default value = None)
+        The axes to draw on (e.g. from plotting.offscreen_figure). None uses the current pyplot axes.
     """
+    import matplotlib
+    from plotting import curve_key, draw_curves
+    
     # read in the data and setup information
-    data = pd.read_excel(exp + "_data.xlsx")
-    setup = pd.read_excel(exp + "_setup.xlsx")
-    groups = [col for col in data.columns if col != "time" and not np.all(data[col]==0)]
-    
-    # data manipulation
-    conc = []
-    for i in groups:
-        # find the total number of worms per well
-        total = max([int(setup[setup["well_num"]==i]["worm_num"]), max(data[i])])
-        # find the amount of E. coli per worm
-        conc.append(int(setup[setup["well_num"]==i]["e_coli"])/total)
-        # find the fraction of worms molting
-        data[i] = data[i]/total
+    data, setup = load_experiment(exp, data_dir, cache_dir)
+    
+    # data manipulation: find the concentration per worm and fraction of worms molting in every well
+    with stage("find_wells"):
+        groups, conc, counts, fraction = find_wells(data, setup)
     
     # find and remove any outliers based on concentration
-    Q3 = np.percentile(np.array(conc), 75)
-    Q1 = np.percentile(np.array(conc), 25)
-    high = Q3 + 1.5*(Q3 - Q1)
-    low = Q1 - 1.5*(Q3 - Q1)
-    groups = np.array(groups)[~((conc > high) | (conc < low))]
-    conc = np.array(conc)[~((conc > high) | (conc < low))]
+    keep = find_outliers(conc)
+    groups = groups[keep]
+    conc = conc[keep]
+    fraction = fraction[:, keep]
     
-    # convert time to hours and subtract the first value
-    times = [i.hour + (i.minute/60) for i in data["time"]]
-    times = np.array(times) - times[0]
+    # subtract the first time (already in hours)
+    times = np.array(data["time"]) - data["time"][0]
     
     # create the title of the plot based on the file name
     main = exp.split("_")
@@ -64,21 +553,25 @@ def make_graph(exp):
         main = "Pilot Experiment " + main[1]
     
     # determine the color of each line using a colormap theme
-    cm = pylab.get_cmap("winter")
+    cm = matplotlib.colormaps["winter"]
     colors = np.array(conc) - min(conc)
     colors = colors/max(colors)
     colors = [cm(1.*i) for i in colors]
     
-    # plot the lines on top of the same figure
-    for i,j in zip(groups, range(len(groups))):
-        plt.plot(times, data[i], marker=".", ms=8, color=colors[j], mfc="0.0", mec="0.0",
-                 label=str(i) + " \u2192 " + str(np.round(conc[j], decimals=3)))
-    plt.xlabel("Hour of Data Collection")
-    plt.ylabel("Fraction of Worms Molting")
-    plt.title(main)
-    plt.legend(title=chr(956) + "L E. coli / worm", bbox_to_anchor=(1,1))
+    # plot every well as one collection of lines on the same figure
+    if ax is None:
+        import matplotlib.pyplot as plt
+        ax = plt.gca()
+    with stage("plot"):
+        labels = [str(i) + " \u2192 " + str(np.round(j, decimals=3)) for i, j in zip(groups, conc)]
+        handles = draw_curves(ax, times, fraction.T, colors, labels, marker=".")[2]
+    ax.set_xlabel("Hour of Data Collection")
+    ax.set_ylabel("Fraction of Worms Molting")
+    ax.set_title(main)
+    curve_key(ax, handles, conc, cm, chr(956) + "L E. coli / worm")
     
-def stats_test(exp_list=["exp_1", "exp_4", "exp_6"], write=False):
+def stats_test(exp_list=["exp_1", "exp_4", "exp_6"], write=False, data_dir=".", cache_dir=None, processes=1, method="t",
+               resamples=10000, seed=None, ax=None):
     """ Plot points showing only statistically significant differences between experimental groups.
     Compare between wells within each experiment, but not across experiments.
     Points are colored and counted based on the quadrant of the graph in which they are located.
@@ -90,68 +583,45 @@ def stats_test(exp_list=["exp_1", "exp_4", "exp_6"], write=False):
     write : a boolean
         If True, each point on the graph will be labeled with the group numbers it represents.
         If False, the points will appear on the graph without labels.
+    data_dir : string (default value = ".")
+        The folder where the experimental data and setup data are stored.
+    cache_dir : string or None (default value = None)
+        The folder where parsed experiments are cached. None uses a folder called ".cache" inside data_dir.
+    processes : None or an int (default value = 1)
+        The number of worker processes used to analyze the experiments. None uses every core.
+    method : a string (default value = "t")
+        "t" for t tests, or "permutation" or "bootstrap" to find the p values by resampling the counts,
+        which does not assume the molt times are normal (see pair_table).
+    resamples : an int (default value = 10000)
+        The number of resamples drawn for each pair when method is "permutation" or "bootstrap".
+    seed : None, an int, a numpy SeedSequence or a numpy Generator (default value = None)
+        The seed of the resamples.
+    ax : None or a matplotlib Axes (default value = None)
+        The axes to draw on (e.g. from plotting.offscreen_figure). None uses the current pyplot axes.
     """
-    # keep track of how many points are in each quadrant
-    green_count = 0
-    red_count = 0
-    orange_count = 0
-    xs = []
-    ys = []
-    
-    # loop through all the valid experiments
-    for exp in exp_list:
-        # read in the data and setup information
-        data = pd.read_excel(exp + "_data.xlsx")
-        setup = pd.read_excel(exp + "_setup.xlsx")
-        groups = [col for col in data.columns if col != "time"and not np.all(data[col]==0)]
-        
-        # data manipulation
-        conc = []
-        for i in groups:
-            # find the total number of worms per well
-            total = max([int(setup[setup["well_num"]==i]["worm_num"]), max(data[i])])
-            # find the amount of E. coli per worm
-            conc.append(int(setup[setup["well_num"]==i]["e_coli"])/total)        
-        
-        # find and remove any outliers based on concentration
-        Q3 = np.percentile(np.array(conc), 75)
-        Q1 = np.percentile(np.array(conc), 25)
-        high = Q3 + 1.5*(Q3 - Q1)
-        low = Q1 - 1.5*(Q3 - Q1)
-        groups = np.array(groups)[~((conc > high) | (conc < low))]
-        conc = np.array(conc)[~((conc > high) | (conc < low))]
-        
-        # create distribution of times based on data
-        times = [i.hour + (i.minute/60) for i in data["time"]]
-        times = np.array(times) - times[0]
-        time_dist = [np.repeat(times,data[i]) for i in groups]
-        
-        # run a pairwise t-test between all groups
-        pairs = np.array([[x,y] for i,x in enumerate(groups) for j,y in enumerate(groups) if i < j])
-        for pair in pairs:
-            # find the correct index
-            a = np.where(groups==pair[0])[0][0]
-            b = np.where(groups==pair[1])[0][0]
-            if len(time_dist[a]) > 1 and len(time_dist[b]) > 1:
-                # plot the differences in groups if significant
-                if stats.ttest_ind(time_dist[a], time_dist[b])[1] < 0.05:
-                    # find the slope and append coordinates to a list
-                    x = conc[b] - conc[a]
-                    xs.append(x)
-                    y = np.mean(time_dist[b]) - np.mean(time_dist[a])
-                    ys.append(y)
-                    # choose colors based on which quadrant the point is in
-                    if x > 0 and y < 0:
-                        plt.plot(x, y, "o", color="green")
-                        green_count += 1
-                    elif x > 0 and y > 0:
-                        plt.plot(x, y, "o", color="red")
-                        red_count += 1
-                    else:
-                        plt.plot(x, y, "o", color="orange")
-                        orange_count += 1
-                    if write:
-                        plt.text(x, y, str(pair))
+    import matplotlib.lines as mlines
+    from plotting import draw_points
+    
+    if ax is None:
+        import matplotlib.pyplot as plt
+        ax = plt.gca()
+    
+    def draw(exp, pairs):
+        # draw the significant pairs of each experiment as it finishes, with one scatter for each quadrant
+        x = pairs["d_conc"].to_numpy()
+        y = pairs["d_mean"].to_numpy()
+        with stage("plot"):
+            draw_points(ax, x, y, find_quadrant(x, y))
+            if write:
+                for pair in pairs.itertuples():
+                    ax.text(pair.d_conc, pair.d_mean, str(np.array([pair.well_a, pair.well_b])))
+    
+    # loop through all the valid experiments, keeping track of how many points are in each quadrant
+    totals = analyze_archive(exp_list, data_dir, cache_dir, processes=processes, callback=draw, method=method,
+                             resamples=resamples, seed=seed)
+    green_count = totals.counts["green"]
+    red_count = totals.counts["red"]
+    orange_count = totals.counts["orange"]
     
     # create the title of the plot based on the experiments used
     main = "Statistically Significant Groups -"
@@ -162,14 +632,15 @@ def stats_test(exp_list=["exp_1", "exp_4", "exp_6"], write=False):
             main += " Pilot Exp " + exp.split("_")[1]
     
     # find and plot the line of best fit
-    m, b = np.polyfit(np.array(xs), np.array(ys), 1)
-    plt.plot(np.array(xs), m*np.array(xs) + b, color="blue")
+    m, b = totals.fit()
+    xs = np.array([totals.x_min, totals.x_max])
+    ax.plot(xs, m*xs + b, color="blue")
     
     # configurations for the rest of the plot
-    plt.axhline(y=0, color="black")
-    plt.xlabel("Difference in Concentrations per Worm")
-    plt.ylabel("Difference in Average Molting Times")
-    plt.title(main)
+    ax.axhline(y=0, color="black")
+    ax.set_xlabel("Difference in Concentrations per Worm")
+    ax.set_ylabel("Difference in Average Molting Times")
+    ax.set_title(main)
     green_points = mlines.Line2D([], [], color="green", marker="o", linestyle="None",
                                  markersize=10, label="negative - " + str(green_count))
     red_points = mlines.Line2D([], [], color="red", marker="o", linestyle="None",
@@ -177,7 +648,228 @@ def stats_test(exp_list=["exp_1", "exp_4", "exp_6"], write=False):
     if orange_count != 0:
         orange_points = mlines.Line2D([], [], color="orange", marker="o", linestyle="None",
                                       markersize=10, label="neutral - " + str(orange_count))
-        plt.legend(handles=[green_points, red_points, orange_points], bbox_to_anchor=(1,1))
+        ax.legend(handles=[green_points, red_points, orange_points], bbox_to_anchor=(1,1))
     else:
-        plt.legend(handles=[green_points, red_points], bbox_to_anchor=(1,1))
-    
\ No newline at end of file
+        ax.legend(handles=[green_points, red_points], bbox_to_anchor=(1,1))
+    
+
+
+class LiveExperiment():
+    """ Follows an experiment while it is running, taking in only the counts added since the last update.
+    The curves and the running count, mean and variance of the times in each well are kept up to date,
+    so refreshing the significant pairs and the plot does not go back over the earlier counts.
+    
+    New counts are read from "<exp>_data.csv" if it exists (an append log with a "time" column and one column
+    per well, read from where the last update stopped), otherwise from "<exp>_data.xlsx" when it changes.
+    
+    Instance Attributes
+    -------------------
+    exp : string (e.g. "exp_4" for experiment #4)
+        The first part of the file names for the data and setup information.
+    data_dir : string
+        The folder where the experimental data and setup data are stored.
+    wells : a numpy array
+        The labels of the wells, in the order of the data columns (empty until the first counts arrive).
+    times : a list of floats
+        The clock time of each count in hours.
+    n, mean, m2 : numpy arrays of floats
+        The number of worms counted in each well, the mean of their times (in hours since the first count)
+        and the sum of squared differences from the mean.
+    """
+    
+    def __init__(self, exp, data_dir=".", equal_var=True):
+        import pandas as pd
+        
+        self.exp = exp
+        self.data_dir = data_dir
+        self.equal_var = equal_var
+        setup = pd.read_excel(os.path.join(data_dir, exp + "_setup.xlsx"))
+        self._setup = setup.set_index("well_num")
+        # every well statistic is empty until the first counts arrive
+        self.wells = np.array([])
+        self.n = np.zeros(0)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.peak = np.zeros(0)
+        self.times = []
+        self._rows = []
+        self._offset = 0
+        self._columns = None
+        self._stamp = None
+        self._layer = {}
+    
+    def add_rows(self, times, counts, wells=None):
+        """ Add new counts to the running statistics (e.g. straight from a plate reader).
+        
+        Parameters
+        ----------
+        times : a list of floats, datetime.time values or text
+            The clock time of each new count.
+        counts : a numpy array with shape (len(times), number of wells)
+            The number of worms glowing in each well at each new time.
+        wells : a list or None (default value = None)
+            The labels of the wells. Needed for the first rows only.
+        """
+        counts = np.asarray(counts, dtype=float).reshape(len(times), -1)
+        if len(self.wells) == 0:
+            if wells is None:
+                raise ValueError("the well labels are needed with the first counts")
+            self.wells = np.array(wells)
+            self.n = np.zeros(len(self.wells))
+            self.mean = np.zeros(len(self.wells))
+            self.m2 = np.zeros(len(self.wells))
+            self.peak = np.zeros(len(self.wells))
+        
+        for t, row in zip(clock_hours(times), counts):
+            self.times.append(t)
+            self._rows.append(row)
+            # add the worms counted at this time to the running mean and variance of each well
+            t = t - self.times[0]
+            total = self.n + row
+            with np.errstate(divide="ignore", invalid="ignore"):
+                delta = t - self.mean
+                self.mean = np.where(total > 0, self.mean + delta*row/total, self.mean)
+                self.m2 = np.where(total > 0, self.m2 + delta**2*self.n*row/total, self.m2)
+            self.n = total
+            self.peak = np.maximum(self.peak, row)
+    
+    def update(self):
+        """ Read the counts added to the data file since the last update.
+        
+        Returns
+        -------
+        new : an int
+            The number of new times.
+        """
+        import pandas as pd
+        
+        before = len(self.times)
+        log = os.path.join(self.data_dir, self.exp + "_data.csv")
+        if os.path.exists(log):
+            with open(log, "rb") as f:
+                f.seek(self._offset)
+                text = f.read()
+            # only whole lines are read, so a line that is still being written waits for the next update
+            text = text[:text.rfind(b"\n") + 1]
+            self._offset += len(text)
+            lines = [line.split(",") for line in text.decode().splitlines() if line.strip()]
+            if self._columns is None and lines:
+                self._columns = [i.strip() for i in lines.pop(0)]
+            if lines:
+                rows = pd.DataFrame(lines, columns=self._columns)
+                wells = [i for i in self._columns if i != "time"]
+                self.add_rows(list(rows["time"]), rows[wells].to_numpy(dtype=float), wells)
+        else:
+            path = os.path.join(self.data_dir, self.exp + "_data.xlsx")
+            stamp = file_stamp(path, self._stamp)
+            if self._stamp is None or stamp["sha1"] != self._stamp["sha1"]:
+                # a workbook has to be parsed again, but only the rows after the last one seen are added
+                raw = pd.read_excel(path)
+                wells = [i for i in raw.columns if i != "time"]
+                new = raw.iloc[len(self.times):]
+                self.add_rows(list(new["time"]), new[wells].to_numpy(), wells)
+            self._stamp = stamp
+        
+        return len(self.times) - before
+    
+    def find_wells(self):
+        """ Find the wells with at least one worm counted, as find_wells does, from the running statistics.
+        
+        Returns
+        -------
+        keep : a numpy array of booleans
+            True for the wells with at least one worm counted.
+        conc : a numpy array of floats
+            The amount of E. coli per worm in each kept well.
+        """
+        keep = self.peak > 0
+        indexed = self._setup.loc[self.wells[keep]]
+        total = np.maximum(indexed["worm_num"].to_numpy().astype(int), self.peak[keep])
+        
+        return keep, indexed["e_coli"].to_numpy().astype(int)/total
+    
+    def curves(self):
+        """ Return the hours since the first count and the fraction of worms molting in every well at each time. """
+        if not self.times:
+            return np.zeros(0), np.zeros((0, len(self.wells)))
+        total = np.maximum(self._setup.loc[self.wells, "worm_num"].to_numpy().astype(int), self.peak)
+        
+        return np.array(self.times) - self.times[0], np.array(self._rows)/total
+    
+    def pair_table(self):
+        """ Run the t tests between every pair of wells (without outliers), as analyze_experiment does.
+        
+        Returns
+        -------
+        pairs : a pandas DataFrame
+            The same columns as pair_table.
+        """
+        keep, conc = self.find_wells()
+        # no well has been counted yet, so there are no pairs to test
+        inside = find_outliers(conc) if len(conc) else np.zeros(0, dtype=bool)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            var = self.m2/(self.n - 1)
+        
+        return pair_stats(self.wells[keep][inside], conc[inside], self.n[keep][inside], self.mean[keep][inside],
+                          var[keep][inside], self.equal_var)
+    
+    def significant(self, alpha=0.05):
+        """ Return the rows of pair_table with a p value below alpha. """
+        pairs = self.pair_table()
+        
+        return pairs[pairs["p"] < alpha].reset_index(drop=True)
+    
+    def plot(self, ax=None):
+        """ Draw the fraction of each well glowing over time, as make_graph does, replacing the data of the lines drawn before.
+        
+        Parameters
+        ----------
+        ax : None or a matplotlib Axes (default value = None)
+            The axes to draw on. None uses the current pyplot axes.
+        """
+        import matplotlib
+        from matplotlib.colorbar import Colorbar
+        from plotting import LEGEND_LIMIT, curve_segments, curve_handles, curve_key, draw_curves
+        
+        keep, conc = self.find_wells()
+        if not len(conc):
+            # nothing is drawn until a worm has been counted
+            return
+        if ax is None:
+            import matplotlib.pyplot as plt
+            ax = plt.gca()
+        times, fraction = self.curves()
+        inside = find_outliers(conc)
+        cm = matplotlib.colormaps["winter"]
+        colors = conc - min(conc)
+        colors = colors/max(colors) if max(colors) > 0 else colors
+        
+        # wells that are now outliers are left out of the curves
+        curves = fraction[:, np.nonzero(keep)[0][inside]].T
+        colors = [cm(1.*i) for i in colors[inside]]
+        labels = [str(well) + " \u2192 " + str(np.round(c, decimals=3)) for well, c in zip(self.wells[keep][inside], conc[inside])]
+        if self._layer.get("ax") is ax:
+            # only the data of the collections that were already drawn is replaced
+            segments = curve_segments(times, curves)
+            self._layer["lines"].set_segments(segments)
+            self._layer["lines"].set_color(colors)
+            self._layer["points"].set_offsets(segments.reshape(-1, 2))
+            ax.ignore_existing_data_limits = True
+            ax.update_datalim(segments.reshape(-1, 2))
+            ax.autoscale_view()
+        else:
+            lines, points = draw_curves(ax, times, curves, colors, marker=".")[:2]
+            self._layer = {"ax": ax, "lines": lines, "points": points, "colorbar": None}
+        ax.set_xlabel("Hour of Data Collection")
+        ax.set_ylabel("Fraction of Worms Molting")
+        ax.set_title("Experiment " + self.exp.split("_")[-1] + " (live)")
+        
+        # a legend replaces the last one by itself, and a colorbar drawn before only needs the new range of concentrations
+        colorbar = self._layer["colorbar"]
+        if colorbar is not None and len(labels) > LEGEND_LIMIT:
+            colorbar.mappable.set_clim(conc[inside].min(), conc[inside].max())
+        else:
+            if colorbar is not None:
+                colorbar.remove()
+            key = curve_key(ax, curve_handles(colors, labels, "."), conc[inside], cm, chr(956) + "L E. coli / worm")
+            self._layer["colorbar"] = key if isinstance(key, Colorbar) else None
@@ -0,0 +1,142 @@
+import numpy as np
+
+
+def _sum(x):
+    # add from left to right (np.sum adds in pairs, so padding with empty bins could change the last digit),
+    # which keeps the results bit-identical however the bins were laid out
+    return np.cumsum(x, axis=-1)[..., -1] if x.shape[-1] else x.sum(axis=-1)
+
+
+def describe_counts(values, counts):
+    """ Find the number, mean and variance of data stored as (value, count) pairs, like a histogram.
+
+    Parameters
+    ----------
+    values : a list or numpy array of floats
+        The distinct values (e.g. mid_bin times or times of data collection).
+    counts : a list or numpy array of integers
+        The number of observations at each value. Extra leading dimensions are treated as separate samples,
+        so counts can have shape (..., len(values)).
+
+    Returns
+    -------
+    n : a float or a numpy array of floats
+        The total number of observations in each sample.
+    mean : a float or a numpy array of floats
+        The mean of each sample, weighted by the counts.
+    var : a float or a numpy array of floats
+        The sample variance (n - 1 in the denominator) of each sample, weighted by the counts.
+    """
+
+    values = np.asarray(values, dtype=float)
+    counts = np.asarray(counts, dtype=float)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        n = _sum(counts)
+        mean = _sum(counts*values)/n
+        # sum of squared deviations, counted once per observation
+        ss = _sum(counts*(values - mean[..., None])**2)
+        var = ss/(n - 1)
+
+    return n, mean, var
+
+
+def ttest_counts(values_1, counts_1, values_2, counts_2, equal_var=True):
+    """ Run a two-sided t test between two samples stored as (value, count) pairs, without expanding them into lists.
+    Gives the same result as scipy.stats.ttest_ind on the repeated values, using O(bins) memory.
+
+    Parameters
+    ----------
+    values_1 : a list or numpy array of floats (sample A)
+        The distinct values of sample A.
+    counts_1 : a list or numpy array of integers (sample A)
+        The number of observations at each value of sample A, with shape (..., len(values_1)).
+    values_2 : a list or numpy array of floats (sample B)
+        The distinct values of sample B.
+    counts_2 : a list or numpy array of integers (sample B)
+        The number of observations at each value of sample B, with shape (..., len(values_2)).
+    equal_var : a boolean (default value = True)
+        If True, run Student's t test with a pooled variance. If False, run Welch's t test.
+
+    Returns
+    -------
+    t : a float or a numpy array of floats
+        The t statistic of each comparison.
+    p : a float or a numpy array of floats
+        The two-sided p value of each comparison (nan if either sample has fewer than two observations).
+    """
+
+    n_1, mean_1, var_1 = describe_counts(values_1, counts_1)
+    n_2, mean_2, var_2 = describe_counts(values_2, counts_2)
+
+    return ttest_stats(n_1, mean_1, var_1, n_2, mean_2, var_2, equal_var)
+
+
+def ttest_stats(n_1, mean_1, var_1, n_2, mean_2, var_2, equal_var=True):
+    """ Run two-sided t tests from the number, mean and variance of each sample (e.g. from describe_counts).
+    Every argument can be an array, so many comparisons are computed at once by broadcasting.
+
+    Parameters
+    ----------
+    n_1, mean_1, var_1 : floats or numpy arrays of floats (sample A)
+        The number of observations, mean and sample variance of sample A.
+    n_2, mean_2, var_2 : floats or numpy arrays of floats (sample B)
+        The number of observations, mean and sample variance of sample B.
+    equal_var : a boolean (default value = True)
+        If True, run Student's t test with a pooled variance. If False, run Welch's t test.
+
+    Returns
+    -------
+    t : a float or a numpy array of floats
+        The t statistic of each comparison.
+    p : a float or a numpy array of floats
+        The two-sided p value of each comparison (nan if either sample has fewer than two observations).
+    """
+
+    # only scipy.special is needed for the t distribution, and it is imported on first use to keep startup fast
+    from scipy.special import stdtr
+
+    t, df = t_statistic(n_1, mean_1, var_1, n_2, mean_2, var_2, equal_var)
+    with np.errstate(invalid="ignore"):
+        p = 2*stdtr(df, -np.abs(t))
+
+    return t, p
+
+
+def t_statistic(n_1, mean_1, var_1, n_2, mean_2, var_2, equal_var=True, shift=0.0):
+    """ Find the t statistic and degrees of freedom from the number, mean and variance of each sample.
+
+    Parameters
+    ----------
+    n_1, mean_1, var_1 : floats or numpy arrays of floats (sample A)
+        The number of observations, mean and sample variance of sample A.
+    n_2, mean_2, var_2 : floats or numpy arrays of floats (sample B)
+        The number of observations, mean and sample variance of sample B.
+    equal_var : a boolean (default value = True)
+        If True, use a pooled variance (Student). If False, use Welch's standard error and degrees of freedom.
+    shift : a float or a numpy array of floats (default value = 0.0)
+        Subtracted from the difference in means before dividing by the standard error (e.g. to center a bootstrap).
+
+    Returns
+    -------
+    t : a float or a numpy array of floats
+        The t statistic of each comparison.
+    df : a float or a numpy array of floats
+        The degrees of freedom of each comparison.
+    """
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if equal_var:
+            # pool the variances of both samples
+            df = n_1 + n_2 - 2
+            pooled = ((n_1 - 1)*var_1 + (n_2 - 1)*var_2)/df
+            se = np.sqrt(pooled*(1/n_1 + 1/n_2))
+        else:
+            # Welch-Satterthwaite degrees of freedom
+            se_1 = var_1/n_1
+            se_2 = var_2/n_2
+            df = (se_1 + se_2)**2/(se_1**2/(n_1 - 1) + se_2**2/(n_2 - 1))
+            se = np.sqrt(se_1 + se_2)
+        t = (mean_1 - mean_2 - shift)/se
+
+    return t, df
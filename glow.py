@@ -0,0 +1,125 @@
+import numpy as np
+from module import Worm, molt_cdf
+from seeding import get_generator
+
+
+def plate_labels(wells, columns=24):
+    """ Label wells like a plate, row by row (A1, A2, ... then B1, ...).
+
+    Parameters
+    ----------
+    wells : an int
+        The number of wells.
+    columns : an int (default value = 24)
+        The number of wells in each row.
+
+    Returns
+    -------
+    labels : a list of strings
+    """
+
+    return [chr(ord("A") + i//columns) + str(i % columns + 1) for i in range(wells)]
+
+
+def glow_counts(times, means, worm_num, spread, rng=None, glow=(1.5, 1.5), expected=False):
+    """ Count the worms glowing in every well at every time of an observation schedule.
+    A worm glows from "before" hours before it molts until "after" hours after, so it is counted at time t
+    if molt - before <= t < molt + after.
+
+    Parameters
+    ----------
+    times : a list or numpy array of floats, from smallest to largest
+        The hours since the worms were put in the wells at which they are counted (need not be evenly spaced).
+    means : a list or numpy array of floats
+        The mean molt age of the worms in each well.
+    worm_num : an int, or a list or numpy array of ints
+        The number of worms in each well.
+    spread : an int or a float
+        Used to controll the variance in starting age of the worm. If the spread is small, worms will be roughly the same age.
+    rng : None, an int, a numpy SeedSequence or a numpy Generator (default value = None)
+        The seed or generator used to create the worms. None uses the shared default generator.
+    glow : a tuple of two floats, or a function (default value = (1.5, 1.5))
+        The hours (before, after) each worm glows around its molt, as in create_bin. A function is called as
+        glow(rng, n) and returns arrays of n before and after hours, so each worm can glow for a different time.
+    expected : a boolean (default value = False)
+        If True, return the expected number of worms glowing instead of creating worms (glow must be a tuple).
+
+    Returns
+    -------
+    counts : a numpy array with shape (len(means), len(times))
+        The number of worms glowing in each well at each time (floats if expected is True).
+    """
+
+    times = np.asarray(times, dtype=float)
+    means = np.asarray(means, dtype=float)
+    worm_num = np.broadcast_to(np.asarray(worm_num, dtype=int), means.shape)
+    if np.any(np.diff(times) < 0):
+        raise ValueError("the observation times must be in order")
+
+    if expected:
+        if callable(glow):
+            raise ValueError("expected counts need a fixed glow window (before, after)")
+        before, after = glow
+        # a worm is glowing at t if its molt time is in (t - after, t + before]
+        inside = molt_cdf(times + before, means[:, None], spread) - molt_cdf(times - after, means[:, None], spread)
+        return worm_num[:, None]*inside
+
+    # create every worm of every well at once, as in Cohort
+    rng = get_generator(rng)
+    well = np.repeat(np.arange(len(means)), worm_num)
+    age = rng.uniform(0, spread, len(well))
+    molt = rng.normal(means[well], Worm.sd) - age
+    if callable(glow):
+        before, after = glow(rng, len(well))
+    else:
+        before, after = glow
+
+    # each glow interval starts being counted at the first time >= its start and stops at the first time >= its end,
+    # so the counts are a running sum of +1 at starts and -1 at ends along the sorted schedule
+    start = np.searchsorted(times, molt - before, side="left")
+    end = np.searchsorted(times, molt + after, side="left")
+    offset = well*(len(times) + 1)
+    steps = np.bincount(offset + start, minlength=len(means)*(len(times) + 1))
+    steps -= np.bincount(offset + end, minlength=len(means)*(len(times) + 1))
+
+    return np.cumsum(steps.reshape(len(means), len(times) + 1), axis=1)[:, :-1]
+
+
+def simulate_plate(schedule, setup, mean_molt, spread=8, rng=None, glow=(1.5, 1.5), expected=False):
+    """ Simulate the data spreadsheet of a plate, in the same form load_experiment returns the real one.
+
+    Parameters
+    ----------
+    schedule : a list of floats, datetime.time, datetime.datetime or strings
+        The clock time of each count (see data_analysis.clock_hours). The worms are put in the wells at the first time.
+    setup : a pandas DataFrame
+        The columns "well_num", "worm_num" and "e_coli", as in the setup spreadsheet.
+    mean_molt : a function
+        Called with the amount of E. coli per worm of every well (a numpy array) and returns the mean molt age of each well.
+    spread : an int or a float (default value = 8)
+        Used to controll the variance in starting age of the worm. If the spread is small, worms will be roughly the same age.
+    rng : None, an int, a numpy SeedSequence or a numpy Generator (default value = None)
+        The seed or generator used to create the worms. None uses the shared default generator.
+    glow : a tuple of two floats, or a function (default value = (1.5, 1.5))
+        The hours (before, after) each worm glows around its molt (see glow_counts).
+    expected : a boolean (default value = False)
+        If True, the counts are the expected number of worms glowing instead of random counts.
+
+    Returns
+    -------
+    data : a pandas DataFrame
+        A column called "time" with the clock time of each count in hours, then one column of counts for each well,
+        which can be passed to find_wells with setup like real data.
+    """
+    import pandas as pd
+    from data_analysis import clock_hours
+
+    hours = clock_hours(schedule)
+    worm_num = setup["worm_num"].to_numpy().astype(int)
+    means = np.asarray(mean_molt(setup["e_coli"].to_numpy()/worm_num), dtype=float)
+    counts = glow_counts(hours - hours[0], means, worm_num, spread, rng, glow, expected)
+
+    data = pd.DataFrame(counts.T, columns=list(setup["well_num"]))
+    data.insert(0, "time", hours)
+
+    return data
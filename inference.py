@@ -0,0 +1,228 @@
+import hashlib
+import multiprocessing
+import os
+import numpy as np
+from module import molt_cdf
+
+
+def well_means(conc, diff, offset, step):
+    """ Find the mean molt time of each well from its food, using the same model as the simulator:
+    wells with less food take longer to molt, "diff" hours for every "step" less E. coli per worm.
+
+    Parameters
+    ----------
+    conc : a numpy array of floats
+        The amount of E. coli per worm in each well.
+    diff : a float or a numpy array of floats
+        The difference in mean molt time between wells "step" apart in food. (UNKNOWN in real life)
+    offset : a float or a numpy array of floats
+        The mean molt time of the best fed well, in hours since the first count.
+    step : a float
+        The difference in E. coli per worm that adds "diff" hours.
+
+    Returns
+    -------
+    means : a numpy array of floats with shape (..., len(conc))
+        The mean molt time of each well, broadcast over the shapes of diff and offset.
+    """
+
+    x = (conc.max() - conc)/step
+
+    return np.asarray(offset)[..., None] + np.asarray(diff)[..., None]*x
+
+
+def grid_log_likelihood(times, counts, total, conc, diffs, spread, offsets, step, glow=(1.5, 1.5)):
+    """ Find the binomial log likelihood of the observed counts for every pair of diff and offset, at one spread.
+    The chance that a worm is glowing at each count comes straight from the molt time distribution (as in glow_counts).
+
+    Parameters
+    ----------
+    times : a numpy array of floats
+        The hours since the first count at which the worms were counted.
+    counts : a numpy array with shape (len(times), number of wells)
+        The number of worms glowing in each well at each time.
+    total : a numpy array of ints
+        The number of worms in each well.
+    conc : a numpy array of floats
+        The amount of E. coli per worm in each well.
+    diffs : a numpy array of floats
+        The values of diff to try.
+    spread : a float
+        The value of spread to try.
+    offsets : a numpy array of floats
+        The mean molt times of the best fed well to try.
+    step : a float
+        The difference in E. coli per worm that adds "diff" hours (see well_means).
+    glow : a tuple of two floats (default value = (1.5, 1.5))
+        The hours (before, after) each worm glows around its molt.
+
+    Returns
+    -------
+    loglik : a numpy array of floats with shape (len(diffs), len(offsets))
+    """
+
+    before, after = glow
+    y = counts.T[None]
+    n = total[None, :, None]
+    loglik = np.empty((len(diffs), len(offsets)))
+
+    # one diff at a time keeps the arrays at (offsets, wells, times)
+    for i, diff in enumerate(diffs):
+        means = well_means(conc, diff, offsets, step)[..., None]
+        p = molt_cdf(times + before, means, spread) - molt_cdf(times - after, means, spread)
+        p = np.clip(p, 1e-12, 1 - 1e-12)
+        loglik[i] = np.sum(y*np.log(p) + (n - y)*np.log1p(-p), axis=(1, 2))
+
+    return loglik
+
+
+def _score_spread(args):
+    # find the log likelihoods of one spread in the worker process
+    times, counts, total, conc, diffs, spread, offsets, step, glow = args
+    return grid_log_likelihood(times, counts, total, conc, diffs, spread, offsets, step, glow)
+
+
+def fit_wells(times, counts, total, conc, diffs, spreads, offsets=None, step=None, glow=(1.5, 1.5),
+              processes=None, cache_path=None):
+    """ Fit diff and spread to the curves of one experiment on a grid, keeping the best offset for each pair.
+
+    Parameters
+    ----------
+    times : a numpy array of floats
+        The hours since the first count at which the worms were counted.
+    counts : a numpy array with shape (len(times), number of wells)
+        The number of worms glowing in each well at each time.
+    total : a numpy array of ints
+        The number of worms in each well.
+    conc : a numpy array of floats
+        The amount of E. coli per worm in each well.
+    diffs : a list or numpy array of floats
+        The values of diff to try.
+    spreads : a list or numpy array of floats
+        The values of spread to try.
+    offsets : None, a list or numpy array of floats (default value = None)
+        The mean molt times of the best fed well to try. None tries every half hour from 10 hours before
+        the first count to 10 hours after the last.
+    step : None or a float (default value = None)
+        The difference in E. coli per worm that adds "diff" hours. None uses a third of the range of conc,
+        so the best and worst fed wells are 3*diff hours apart, like the four groups of the simulator.
+    glow : a tuple of two floats (default value = (1.5, 1.5))
+        The hours (before, after) each worm glows around its molt.
+    processes : None or an int (default value = None)
+        The number of worker processes. None uses every core, and 1 runs everything in this process.
+    cache_path : None or a string (default value = None)
+        A ".npz" file where the log likelihood of every spread is saved, so a fit with the same data
+        and grid only computes the spreads it has not seen. None turns off the cache.
+
+    Returns
+    -------
+    loglik : a numpy array of floats with shape (len(diffs), len(spreads))
+        The log likelihood of each pair, at its best offset.
+    best_offset : a numpy array of floats with shape (len(diffs), len(spreads))
+        The offset that gave each log likelihood.
+    """
+
+    times = np.asarray(times, dtype=float)
+    counts = np.asarray(counts, dtype=float)
+    total = np.asarray(total, dtype=float)
+    conc = np.asarray(conc, dtype=float)
+    diffs = np.asarray(diffs, dtype=float)
+    spreads = np.asarray(spreads, dtype=float)
+    if offsets is None:
+        offsets = np.arange(times.min() - 10, times.max() + 10.5, 0.5)
+    offsets = np.asarray(offsets, dtype=float)
+    if step is None:
+        step = (conc.max() - conc.min())/3 if conc.max() > conc.min() else 1.0
+
+    # the cache key covers everything that changes the log likelihood of a spread
+    found = {}
+    if cache_path is not None:
+        text = hashlib.sha1()
+        for i in [times, counts, total, conc, diffs, offsets, np.array([step, *glow])]:
+            text.update(np.ascontiguousarray(i).tobytes())
+        key = text.hexdigest()
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as f:
+                if str(f["key"]) == key:
+                    found = {float(s): grid for s, grid in zip(f["spreads"], f["loglik"])}
+
+    tasks = [(times, counts, total, conc, diffs, s, offsets, step, glow) for s in spreads if float(s) not in found]
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes == 1 or len(tasks) < 2:
+        results = list(map(_score_spread, tasks))
+    else:
+        with multiprocessing.Pool(min(processes, len(tasks))) as pool:
+            results = pool.map(_score_spread, tasks)
+    for task, grid in zip(tasks, results):
+        found[float(task[5])] = grid
+
+    if cache_path is not None and tasks:
+        # write to a temporary file first so an interrupted fit never leaves a broken cache file
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        with open(cache_path + ".tmp", "wb") as f:
+            np.savez(f, key=np.array(key), spreads=np.array(list(found)), loglik=np.array(list(found.values())))
+        os.replace(cache_path + ".tmp", cache_path)
+
+    # keep the best offset of every pair of diff and spread
+    grid = np.stack([found[float(s)] for s in spreads], axis=1)
+
+    return grid.max(axis=2), offsets[grid.argmax(axis=2)]
+
+
+def fit_experiments(exp_list, diffs=np.arange(0, 4.01, 0.1), spreads=np.arange(0, 16.01, 0.5), data_dir=".",
+                    cache_dir=None, offsets=None, step=None, glow=(1.5, 1.5), processes=None):
+    """ Estimate diff and spread from the curves of lab experiments, by the likelihood of every pair on a grid.
+    Each experiment has its own best offset (the worms' age at the first count is not known), and the log
+    likelihoods of the experiments are added.
+
+    Parameters
+    ----------
+    exp_list : a list of strings
+        The experiments to fit (e.g. ["exp_1", "exp_4"]), read with load_experiment.
+    diffs : a list or numpy array of floats (default value = every 0.1 from 0 to 4)
+        The values of diff to try.
+    spreads : a list or numpy array of floats (default value = every 0.5 from 0 to 16)
+        The values of spread to try.
+    data_dir : string (default value = ".")
+        The folder where the experimental data and setup data are stored.
+    cache_dir : string or None (default value = None)
+        The folder where parsed experiments and fits are cached. None uses a folder called ".cache" inside data_dir.
+    offsets : None, a list or numpy array of floats (default value = None)
+        The mean molt times of the best fed well to try (see fit_wells).
+    step : None or a float (default value = None)
+        The difference in E. coli per worm that adds "diff" hours (see fit_wells).
+    glow : a tuple of two floats (default value = (1.5, 1.5))
+        The hours (before, after) each worm glows around its molt.
+    processes : None or an int (default value = None)
+        The number of worker processes. None uses every core, and 1 runs everything in this process.
+
+    Returns
+    -------
+    fit : a pandas DataFrame
+        One row for each pair, with the columns "diff", "spread" and "loglik" (added over the experiments).
+        fit.loc[fit["loglik"].idxmax()] is the best fit.
+    """
+    import pandas as pd
+    from data_analysis import load_experiment, find_wells, find_outliers
+
+    if cache_dir is None:
+        cache_dir = os.path.join(data_dir, ".cache")
+    loglik = 0
+    for exp in exp_list:
+        # the wells as in make_graph, from the cached experiment
+        data, setup = load_experiment(exp, data_dir, cache_dir)
+        groups, conc, counts = find_wells(data, setup)[:3]
+        keep = find_outliers(conc)
+        worm_num = setup.set_index("well_num").loc[groups, "worm_num"].to_numpy()
+        total = np.maximum(worm_num, counts.max(axis=0, initial=0))
+        times = np.array(data["time"]) - data["time"][0]
+
+        # the file keeps the spreads already fitted, and is started again if the data or the rest of the grid change
+        cache_path = os.path.join(cache_dir, exp + "_fit.npz")
+        loglik = loglik + fit_wells(times, counts[:, keep], total[keep], conc[keep], diffs, spreads, offsets, step,
+                                    glow, processes, cache_path)[0]
+
+    d, s = np.meshgrid(diffs, spreads, indexing="ij")
+
+    return pd.DataFrame({"diff": d.ravel(), "spread": s.ravel(), "loglik": np.ravel(loglik)})
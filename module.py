@@ -1,8 +1,21 @@
-import random as rnd
-from scipy import stats
+from dataclasses import dataclass
+from functools import lru_cache
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.patches as mp
+from freq_stats import describe_counts, ttest_counts
+from profiling import stage
+from seeding import WormStreams, get_generator
+
+
+# the food concentrations of the four treatment groups, from most to least food
+CONCENTRATIONS = ["6 mg/mL", "4.8 mg/mL", "3.6 mg/mL", "2.4 mg/mL"]
+
+# the colors of the four treatment groups in plots (more groups use a colormap)
+COLORS = ["blue", "orange", "green", "red"]
+
+# the version of the random numbers behind each seed, hashed into the sweep cache keys so results from different
+# versions never mix (1: one worm at a time, 2: replicates batched on a common bin grid, 3: per-replicate PCG64
+# streams). It must be bumped by any change that makes a seed give different replicates.
+ENGINE_VERSION = 3
 
 
 class Worm():
@@ -17,7 +30,7 @@ class Worm():
         
     Instance Attributes
     -------------------
-    molt_age : input a string from the list of food concentrations ["6 mg/mL", "4.8 mg/mL", "3.6 mg/mL", "2.4 mg/mL"]
+    molt_age : input a food concentration from groups (by default one of ["6 mg/mL", "4.8 mg/mL", "3.6 mg/mL", "2.4 mg/mL"])
         With less food concentration, the worm is expected to take longer to molt.
     spread : input an int or a float
         Used to controll the variance in starting age of the worm. If the spread is small, worms will be roughly the same age.
@@ -25,58 +38,184 @@ class Worm():
         The difference in means between treatment groups. (UNKNOWN in real life)
     age : a random choice of float between zero and spread (no input required)
         This is controlled by spread. It determines how soon the worm will molt, depending on its age.
+    rng : None, an int, a numpy SeedSequence or a numpy Generator (optional input)
+        The seed or generator used to draw age and molt_age. None uses the shared default generator.
+    groups : None, a list or a dictionary (optional input)
+        The treatment groups, as in group_means. None uses CONCENTRATIONS.
     """
     
     mean = 15
     sd = 2
     
-    def __init__(self, molt_age, spread, diff):
+    def __init__(self, molt_age, spread, diff, rng=None, groups=None):
+        
+        # None uses the shared default generator, never the global random or np.random state
+        rng = get_generator(rng)
         
         self.spread = spread
         self.diff = diff
-        self.age = rnd.uniform(0, self.spread)
+        self.age = rng.uniform(0, self.spread)
+        
+        # look up the mean molt age of the worm's food concentration
+        labels, means = group_means(diff, groups)
+        if molt_age not in labels:
+            raise ValueError("unknown food concentration " + repr(molt_age))
+        # choose a random float based on the normal distribution, centered around the group's mean with "sd"
+        self.molt_age = rng.normal(means[labels.index(molt_age)], self.sd)
+
+    @classmethod
+    def from_values(cls, molt_age, age, spread, diff):
+        """ Create a Worm from values that were already drawn, without drawing any new random numbers.
         
-        # based on the input for molt_age, change the attribute to a float that determines when the worm will molt
-        if molt_age == "6 mg/mL":
-            # choose a random float based on the normal distribution, centered around the "mean" with "sd"
-            self.molt_age = np.random.normal(self.mean, self.sd)
+        Parameters
+        ----------
+        molt_age : a float
+            The number of hours this worm needs to reach before it molts.
+        age : a float
+            The starting age of this worm, between zero and spread.
+        spread : an int or a float
+            Used to controll the variance in starting age of the worm.
+        diff : an int or a float
+            The difference in means between treatment groups. (UNKNOWN in real life)
         
-        elif molt_age == "4.8 mg/mL":
-            # each treatment group's mean is increased in multiples of "diff"
-            self.molt_age = np.random.normal(self.mean + self.diff, self.sd)
+        Returns
+        -------
+        worm : an object of the class Worm
+        """
         
-        elif molt_age == "3.6 mg/mL":
-            self.molt_age = np.random.normal(self.mean + 2*self.diff, self.sd)
+        worm = cls.__new__(cls)
+        worm.spread = spread
+        worm.diff = diff
+        worm.age = float(age)
+        worm.molt_age = float(molt_age)
         
-        elif molt_age == "2.4 mg/mL":
-            self.molt_age = np.random.normal(self.mean + 3*self.diff, self.sd)
+        return worm
 
 
-def create_groups(spread, diff, size):
-    """ Create the 4 treatment groups using the Class Worm.
+def group_means(diff, groups=None):
+    """ Find the food concentration and mean molt age of each treatment group.
     
     Parameters
     ----------
+    diff : an int or a float
+        The difference in means between neighbouring treatment groups, used when groups is None or a list.
+    groups : None, a list or a dictionary (default value = None)
+        None uses the four groups in CONCENTRATIONS. A list of concentrations (from most to least food) gives each group
+        a mean "diff" hours longer than the one before, starting at Worm.mean. A dictionary sets the mean molt age
+        of each concentration directly (e.g. from a dose-response curve), in the order of its keys.
+    
+    Returns
+    -------
+    labels : a list
+        The food concentration of each treatment group.
+    means : a numpy array of floats
+        The mean molt age of each treatment group, in hours.
+    """
+    
+    if groups is None:
+        groups = CONCENTRATIONS
+    if isinstance(groups, dict):
+        return list(groups), np.array(list(groups.values()), dtype=float)
+    
+    # each treatment group's mean is increased in multiples of "diff"
+    labels = list(groups)
+    return labels, Worm.mean + np.arange(len(labels))*diff
+
+
+class Cohort():
+    """ Stores every worm of all the treatment groups as NumPy arrays instead of one Worm object per animal.
+    All random values are drawn in two batched calls from WormStreams, so large cohorts are fast to create and cheap to store.
+    
+    Instance Attributes
+    -------------------
     spread : an int or a float
         Used to controll the variance in starting age of the worm. If the spread is small, worms will be roughly the same age.
     diff : an int or a float
         The difference in means between treatment groups. (UNKNOWN in real life)
     size : an int
         The number of worms in each treatment group.
+    labels : a list
+        The food concentration of each treatment group (see group_means).
+    means : a numpy array of floats
+        The mean molt age of each treatment group.
+    group : a numpy array of integers
+        The treatment group of each worm, used as an index into labels.
+    age : a numpy array of floats
+        The starting age of each worm, a random choice between zero and spread.
+    molt_age : a numpy array of floats
+        The age each worm needs to reach before molting, drawn from the normal distribution of its group.
+    """
+    
+    def __init__(self, spread, diff, size, rng=None, groups=None):
+        
+        # the worms are replicate 0 of the seed's streams, so they match the first replicate of simulate_batch
+        streams = WormStreams(rng)
+        
+        self.spread = spread
+        self.diff = diff
+        self.size = size
+        self.labels, self.means = group_means(diff, groups)
+        
+        # worms are stored group after group, so each group is a contiguous block of "size" worms
+        self.group = np.repeat(np.arange(len(self.labels)), size)
+        self.age = spread*streams.uniform(0, (1, self.group.size))[0]
+        self.molt_age = self.means[self.group] + Worm.sd*streams.normal(0, (1, self.group.size))[0]
+        # the Worm objects of each group, built the first time the group is indexed
+        self._worms = {}
+    
+    def __len__(self):
+        return len(self.labels)
+    
+    def __getitem__(self, group):
+        # build Worm objects on demand so old code indexing worms[i][j] keeps working
+        if group < 0:
+            group += len(self)
+        if not 0 <= group < len(self):
+            raise IndexError("treatment group index out of range")
+        if group not in self._worms:
+            block = slice(group*self.size, (group + 1)*self.size)
+            self._worms[group] = [Worm.from_values(m, a, self.spread, self.diff)
+                                  for m, a in zip(self.molt_age[block], self.age[block])]
+        return self._worms[group]
+    
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+    
+    def find_molt(self):
+        """ Determine when each worm molts by molt_age minus current age, for all groups at once.
+        
+        Returns
+        -------
+        molt : a list of numpy arrays of floats
+            There is an array for each treatment group, containing the time required for each worm to molt.
+        """
+        
+        return np.split(self.molt_age - self.age, len(self.labels))
+
+
+def create_groups(spread, diff, size, rng=None, groups=None):
+    """ Create the treatment groups (4 by default) as a Cohort of NumPy arrays.
+    
+    Parameters
+    ----------
+    spread : an int or a float
+        Used to controll the variance in starting age of the worm. If the spread is small, worms will be roughly the same age.
+    diff : an int or a float
+        The difference in means between treatment groups. (UNKNOWN in real life)
+    size : an int
+        The number of worms in each treatment group.
+    rng : None, an int or a numpy Generator (default value = None)
+        The seed or generator used to draw ages and molt ages. None uses fresh entropy.
+    groups : None, a list or a dictionary (default value = None)
+        The food concentrations and mean molt ages of the treatment groups (see group_means). None uses CONCENTRATIONS.
     
     Returns
     -------
-    worms : a list of four lists of objects
-        There are four lists (one for each treatment group) and within those lists, there are worm objects.
+    worms : an object of the class Cohort
+        Indexing worms[i][j] still gives a Worm object for group i, worm j.
     """
     
-    worms = []
-    
-    for i in ["6 mg/mL", "4.8 mg/mL", "3.6 mg/mL", "2.4 mg/mL"]:
-        # the molt_age is a choice of food concentrations in the list above, one for each group
-        worms.append([Worm(i, spread, diff) for j in range(size)])
-    
-    return worms
+    return Cohort(spread, diff, size, rng, groups)
 
 
 def find_molt(size, worms):
@@ -86,18 +225,22 @@ def find_molt(size, worms):
     ----------
     size : an int
         The number of worms in each treatment group.
-    worms : a list of four lists of objects
-        There are four lists (one for each treatment group) and within those lists, there are worm objects.
+    worms : an object of the class Cohort, or a list of lists of objects
+        Either the Cohort from create_groups, or one list for each treatment group of worm objects.
     
     Returns
     -------
-    molt : a list of four non-empty lists of floats
-        There are four lists (one for each treatment group) and within those lists, the time required for a worm to molt.
+    molt : a list of non-empty lists (or numpy arrays) of floats
+        There is a list for each treatment group and within those lists, the time required for a worm to molt.
     """
     
-    molt = [[] for i in range(4)]
+    if isinstance(worms, Cohort):
+        # subtract the whole arrays at once instead of looping through worm objects
+        return worms.find_molt()
     
-    for i in range(4):
+    molt = [[] for i in range(len(worms))]
+    
+    for i in range(len(worms)):
         for j in range(size):
             # loop through each worm in every group to determine how many hours it will take to molt
             molt[i].append(worms[i][j].molt_age - worms[i][j].age)
@@ -110,8 +253,8 @@ def find_small(molt, hour):
     
     Parameters
     ----------
-    molt : a list of four non-empty lists of floats
-        There are four lists (one for each treatment group) and within those lists, the time required for a worm to molt.
+    molt : a list of non-empty lists of floats
+        There is a list for each treatment group and within those lists, the time required for a worm to molt.
     hour : an int or a float
         This represents the frequency that data are collected. (ie worms counted ____ times per hour)
     
@@ -122,7 +265,7 @@ def find_small(molt, hour):
     """
     
     # find the smallest molting time of all the groups
-    small = min(min(molt[0]), min(molt[1]), min(molt[2]), min(molt[3]))
+    small = float(min(np.min(i) for i in molt))
     
     if round(small/hour)*hour > small:
         # if rounding it to the nearest "hour" rounds up, then subtract "hour"
@@ -138,8 +281,8 @@ def find_big(molt, hour):
     
     Parameters
     ----------
-    molt : a list of four non-empty lists of floats
-        There are four lists (one for each treatment group) and within those lists, the time required for a worm to molt.
+    molt : a list of non-empty lists of floats
+        There is a list for each treatment group and within those lists, the time required for a worm to molt.
     hour : an int or a float
         This represents the frequency that data are collected. (ie worms counted ____ times per hour)
     
@@ -150,7 +293,7 @@ def find_big(molt, hour):
     """
     
     # find the largest molting time of all the groups
-    big = max(max(molt[0]), max(molt[1]), max(molt[2]), max(molt[3]))
+    big = float(max(np.max(i) for i in molt))
     
     if round(big/hour)*hour < big:
         # if rounding it to the nearest "hour" rounds down, then add "hour"
@@ -208,6 +351,212 @@ def create_bin(mid_bin):
     return bins
 
 
+def find_bin_edges(sorted_molt, bins):
+    """ Find where each bin starts and ends within an array of sorted molt times.
+    
+    Parameters
+    ----------
+    sorted_molt : a numpy array of floats, sorted from smallest to largest
+        The time required for each worm of one treatment group to molt.
+    bins : a list of lists, each one contains two floats
+        The two floats in each inner list represent the start time and end time for each bin.
+    
+    Returns
+    -------
+    lo : a numpy array of integers
+        For each bin, the index of the first molt time that is >= the start time of the bin.
+    hi : a numpy array of integers
+        For each bin, the index of the first molt time that is >= the end time of the bin.
+    """
+    
+    bins = np.asarray(bins, dtype=float).reshape(-1, 2)
+    # a molt time j is in a bin if start <= j < end, so both edges are searched from the left
+    lo = np.searchsorted(sorted_molt, bins[:, 0], side="left")
+    hi = np.searchsorted(sorted_molt, bins[:, 1], side="left")
+    
+    return lo, hi
+
+
+def count_worm(group, bins, molt, slices=False):
+    """ Count the worms that fall into each bin by sorting the molt times once and searching for the bin edges.
+    
+    Parameters
+    ----------
+    group : an integer (0, 1, 2, or 3)
+        This is used as an index into molt to determine which treatment group is being sorted.
+    bins : a list of lists, each one contains two floats
+        The two floats in each inner list represent the start time and end time for each bin.
+    molt : a list of four lists (or numpy arrays) of floats
+        There are four lists (one for each treatment group) and within those lists, the time required for a worm to molt.
+    slices : a boolean (default value = False)
+        If True, also return the sorted molt times and a slice into them for each bin.
+    
+    Returns
+    -------
+    counts : a numpy array of integers
+        The number of worms in each bin.
+    sorted_molt : a numpy array of floats (only if slices is True)
+        The molt times of the treatment group, sorted from smallest to largest.
+    bin_slices : a list of slices (only if slices is True)
+        sorted_molt[bin_slices[i]] are the molt times of the worms in bin i.
+    """
+    
+    sorted_molt = np.sort(np.asarray(molt[group], dtype=float), kind="stable")
+    lo, hi = find_bin_edges(sorted_molt, bins)
+    counts = hi - lo
+    
+    if slices:
+        return counts, sorted_molt, [slice(i, j) for i, j in zip(lo, hi)]
+    
+    return counts
+
+
+def count_groups(bins, molt):
+    """ Count the worms of every treatment group that fall into each bin, all groups in one pass.
+    Gives the same counts as count_worm on each group.
+    
+    Parameters
+    ----------
+    bins : a list of lists, each one contains two floats
+        The two floats in each inner list represent the start time and end time for each bin.
+    molt : a list of lists (or numpy arrays) of floats, or a numpy array with shape (groups, size)
+        There is a list for each treatment group and within those lists, the time required for a worm to molt.
+        The groups do not need to be the same size.
+    
+    Returns
+    -------
+    counts : a numpy array of integers with shape (len(molt), len(bins))
+        The number of worms of each treatment group in each bin.
+    """
+    
+    bins = np.asarray(bins, dtype=float).reshape(-1, 2)
+    
+    # every bin starts and ends at one of these edges, so a worm's bins only depend on its place among the edges
+    edges = np.unique(bins.ravel())
+    lo = np.searchsorted(edges, bins[:, 0])
+    hi = np.searchsorted(edges, bins[:, 1])
+    
+    return _count_at_edges(edges, lo, hi, molt)
+
+
+def _count_at_edges(edges, lo, hi, molt):
+    # count each group's worms in the bins that run from edges[lo] to edges[hi], in one pass over all worms
+    sizes = [len(i) for i in molt]
+    values = np.concatenate([np.asarray(i, dtype=float).ravel() for i in molt]) if len(molt) else np.zeros(0)
+    
+    # for each worm, the number of edges <= its molt time, then a histogram of that for each group
+    place = np.searchsorted(edges, values, side="right")
+    group = np.repeat(np.arange(len(sizes)), sizes)
+    hist = np.bincount(group*(len(edges) + 1) + place, minlength=len(sizes)*(len(edges) + 1))
+    # below[:, e] is the number of worms that molt before edges[e]
+    below = np.cumsum(hist.reshape(len(sizes), len(edges) + 1), axis=1)
+    
+    return below[:, hi] - below[:, lo]
+
+
+class BinPlan():
+    """ Stores a grid of counting times with its bin edges and the place of every bin among the edges,
+    so many replicates (and sweep points) with the same hour and range can be counted without rebuilding the bins.
+    Plans are made with bin_plan, which keeps the most recently used ones.
+    
+    Instance Attributes
+    -------------------
+    hour : an int or a float
+        This represents the frequency that data are collected. (ie worms counted ____ times per hour)
+    width : an int or a float
+        The width of each bin in hours (3 for the 1.5 hours before and after each count, as in create_bin).
+    first : an int
+        The first counting time is first*hour.
+    last : an int
+        The last counting time is last*hour.
+    steps : a numpy array of integers
+        Every counting time as a whole number of "hour" steps, from first to last.
+    edges : a numpy array of floats
+        The sorted start and end times of all the bins.
+    lo : a numpy array of integers
+        For each bin, its start time's place in edges.
+    hi : a numpy array of integers
+        For each bin, its end time's place in edges.
+    """
+    
+    def __init__(self, hour, width, first, last):
+        self.hour = hour
+        self.width = width
+        self.first = first
+        self.last = last
+        self.steps = np.arange(first, last + 1)
+        mid_bin = self.steps*hour
+        self.edges = np.unique(np.concatenate([mid_bin - width/2, mid_bin + width/2]))
+        self.lo = np.searchsorted(self.edges, mid_bin - width/2)
+        self.hi = np.searchsorted(self.edges, mid_bin + width/2)
+        # plans are shared, so their arrays are read only
+        for i in [self.steps, self.edges, self.lo, self.hi]:
+            i.flags.writeable = False
+    
+    def window(self, first=None, last=None):
+        """ Return the slice of the plan's bins from first*hour to last*hour (None keeps the plan's own end). """
+        
+        start = 0 if first is None else int(first) - self.first
+        stop = len(self.steps) if last is None else int(last) - self.first + 1
+        return slice(start, stop)
+    
+    def mid_bin(self, first=None, last=None):
+        """ Return the counting times from first*hour to last*hour as a new list, like find_mid_bin. """
+        
+        return (self.steps[self.window(first, last)]*self.hour).tolist()
+    
+    def bins(self, first=None, last=None):
+        """ Return the bins from first*hour to last*hour as a list of [start, end] lists, like create_bin. """
+        
+        sl = self.window(first, last)
+        return np.stack([self.edges[self.lo[sl]], self.edges[self.hi[sl]]], axis=1).tolist()
+    
+    def count(self, molt, first=None, last=None):
+        """ Count the worms of every treatment group in each bin from first*hour to last*hour.
+        
+        Parameters
+        ----------
+        molt : a list of lists (or numpy arrays) of floats, or a numpy array with shape (groups, size)
+            There is a list for each treatment group and within those lists, the time required for a worm to molt.
+        first : None or an int (default value = None)
+            The first bin to count. None starts at the plan's first bin.
+        last : None or an int (default value = None)
+            The last bin to count. None ends at the plan's last bin.
+        
+        Returns
+        -------
+        counts : a numpy array of integers with shape (len(molt), number of bins)
+            The same counts as count_groups with the same bins.
+        """
+        
+        sl = self.window(first, last)
+        return _count_at_edges(self.edges, self.lo[sl], self.hi[sl], molt)
+
+
+@lru_cache(maxsize=256)
+def bin_plan(hour, first, last, width=3):
+    """ Make (or reuse) the BinPlan of the counting times first*hour to last*hour.
+    The most recently used 256 plans are kept (see bin_plan.cache_info() and bin_plan.cache_clear()).
+    
+    Parameters
+    ----------
+    hour : an int or a float
+        This represents the frequency that data are collected. (ie worms counted ____ times per hour)
+    first : an int
+        The first counting time is first*hour.
+    last : an int
+        The last counting time is last*hour.
+    width : an int or a float (default value = 3)
+        The width of each bin in hours.
+    
+    Returns
+    -------
+    plan : an object of the class BinPlan
+    """
+    
+    return BinPlan(hour, width, first, last)
+
+
 def sort_worm(group, bins, molt):
     """ Determine worms that fall into each bin based on when they molt.
     
@@ -223,16 +572,15 @@ def sort_worm(group, bins, molt):
     Returns
     -------
     sorted_worms : a list of lists of floats
-        There is a list for each bin, containing the molt times of all the worms that fall into that bin.
+        There is a list for each bin, containing the molt times of all the worms that fall into that bin (in the order of molt).
     """
     
-    sorted_worms = [[] for i in range(len(bins))]
-    for i in range(len(bins)):
-        for j in molt[group]:
-            # look at each molt time of a particular treatment group
-            if j >= bins[i][0] and j < bins[i][1]:
-                # if the molt time of a worm is between the start time and end time of a bin, append it
-                sorted_worms[i].append(j)
+    # sort once, then cut the sorted molt times at the edges of each bin
+    values = np.asarray(molt[group], dtype=float)
+    order = np.argsort(values, kind="stable")
+    lo, hi = find_bin_edges(values[order], bins)
+    # put the worms of each bin back in the order they were given
+    sorted_worms = [values[np.sort(order[i:j])].tolist() for i, j in zip(lo, hi)]
     
     return sorted_worms
 
@@ -262,19 +610,61 @@ def fix_data(sorted_worms, mid_bin):
     return flat_worm
 
 
-def stats_test(flat_1, flat_2):
+def stats_test(flat_1, flat_2, mid_bin=None, method="t", resamples=10000, seed=None):
     """ Prints one-tailed p values and significance between flat_worm data from the treatment groups.
     
     Parameters
     ----------
     flat_1 : a list of integers or floats (treatment group A)
         The values are from mid_bin, but the frequency of each is dependent on how many worms are counted per bin.
+        If mid_bin is given, this is instead the number of worms counted in each bin (from count_worm).
     flat_2 : a list of integers or floats (treatment group B)
         The values are from mid_bin, but the frequency of each is dependent on how many worms are counted per bin.
+        If mid_bin is given, this is instead the number of worms counted in each bin (from count_worm).
+    mid_bin : a list of integers or floats (default value = None)
+        Worms will be counted at each hour indicated in this list. If given, the t test runs on the counts directly.
+    method : a string (default value = "t")
+        "t" for a t test, or "permutation" or "bootstrap" to find the p value of the t statistic by resampling
+        the counts (see resample.resample_test), which does not assume the molt times are normal.
+        Every p value is one-tailed, in the direction of the observed difference in means.
+    resamples : an int (default value = 10000)
+        The number of resamples drawn when method is "permutation" or "bootstrap".
+    seed : None, an int, a numpy SeedSequence or a numpy Generator (default value = None)
+        The seed of the resamples.
     """
     
-    # divide by 2 to make the p value for a one-sided t test
-    test = stats.ttest_ind(flat_1, flat_2)[1]/2
+    if method != "t":
+        from resample import resample_test
+        if mid_bin is None:
+            # turn the flat_worm lists into counts at each distinct value
+            split = len(flat_1)
+            mid_bin, inverse = np.unique(np.concatenate([flat_1, flat_2]), return_inverse=True)
+            flat_1 = np.bincount(inverse[:split], minlength=len(mid_bin))
+            flat_2 = np.bincount(inverse[split:], minlength=len(mid_bin))
+        # a one-sided test in the direction of the observed difference, like the halved t test p value
+        t = ttest_counts(mid_bin, flat_1, mid_bin, flat_2)[0]
+        alternative = "less" if t < 0 else "greater"
+        test = resample_test(mid_bin, flat_1, flat_2, method, resamples, alternative, seed)[1]
+    elif mid_bin is None:
+        # scipy.stats is slow to import, so it is only loaded for the flat_worm lists
+        # divide by 2 to make the p value for a one-sided t test
+        from scipy import stats
+        test = stats.ttest_ind(flat_1, flat_2)[1]/2
+    else:
+        # use the counts per bin, so the flat_worm lists never need to be built
+        test = ttest_counts(mid_bin, flat_1, mid_bin, flat_2)[1]/2
+    
+    print_p_value(test)
+
+
+def print_p_value(test):
+    """ Prints a one-tailed p value and whether it is significant.
+    
+    Parameters
+    ----------
+    test : a float
+        The one-tailed p value of a t test between two treatment groups.
+    """
     
     print("p value =", test, end=" ")
     # set the significance threshold to be 0.05
@@ -307,100 +697,591 @@ def find_density(sorted_worms, size):
     return sorted_worms
 
 
-def make_plot(mid_bin, worms0, worms1, worms2, worms3):
+def find_step_range(low, high, hour):
+    """ Find the counting times of find_small, find_big and find_mid_bin as whole numbers of "hour" steps,
+    from only the smallest and largest molt times.
+    
+    Parameters
+    ----------
+    low : a float or a numpy array of floats
+        The smallest molt time (of each replicate).
+    high : a float or a numpy array of floats
+        The largest molt time (of each replicate).
+    hour : an int or a float
+        This represents the frequency that data are collected. (ie worms counted ____ times per hour)
+    
+    Returns
+    -------
+    first : an int or a numpy array of integers
+        The first counting time is first*hour.
+    last : an int or a numpy array of integers
+        The last counting time is last*hour.
+    """
+    
+    # round the smallest time down and the largest time up to a multiple of "hour", exactly as find_small and find_big do
+    small = np.round(low/hour)*hour
+    small = np.where(small > low, small - hour, small)
+    big = np.round(high/hour)*hour
+    big = np.where(big < high, big + hour, big)
+    # find_mid_bin uses np.arange, which can add one extra time past big when "hour" is not exact in binary
+    first = np.round(small/hour).astype(int)
+    last = first + np.ceil((big + hour - small)/hour).astype(int) - 1
+    
+    return first, last
+
+
+def count_batch(molt, hour):
+    """ Count the worms in each bin for many replicates at once, using one common grid of bins.
+    Gives the same counts as find_small, find_big, find_mid_bin, create_bin and count_worm on each replicate.
+    
+    Parameters
+    ----------
+    molt : a numpy array of floats with shape (reps, groups, size)
+        The time required for each worm of each treatment group of each replicate to molt.
+    hour : an int or a float
+        This represents the frequency that data are collected. (ie worms counted ____ times per hour)
+    
+    Returns
+    -------
+    mid_bin : a list of integers or floats
+        The common counting times, covering the bins of every replicate.
+    counts : a numpy array of integers with shape (reps, groups, len(mid_bin))
+        The number of worms counted in each bin. Bins outside a replicate's own range are zero.
+    """
+    
+    molt = np.asarray(molt, dtype=float)
+    reps, groups = molt.shape[:2]
+    first, last = find_step_range(molt.min(axis=(1, 2)), molt.max(axis=(1, 2)), hour)
+    
+    # one grid of counting times (multiples of "hour") that covers every replicate, reused while the range is the same
+    plan = bin_plan(hour, int(first.min()), int(last.max()))
+    
+    # every group of every replicate is counted in the same pass
+    counts = plan.count(molt.reshape(reps*groups, -1)).reshape(reps, groups, len(plan.steps))
+    
+    # each replicate only counts worms at its own times, from its small to its big
+    outside = (plan.steps < first[:, None]) | (plan.steps > last[:, None])
+    counts[np.broadcast_to(outside[:, None, :], counts.shape)] = 0
+    
+    return plan.mid_bin(), counts
+
+
+def simulate_batch(hour, spread, size, diff, reps, rng=None, first=0, groups=None):
+    """ Simulate many replicates of all the treatment groups as one array, without printing or plotting.
+    
+    Parameters
+    ----------
+    hour : an int or a float
+        This represents the frequency that data are collected. (ie worms counted ____ times per hour)
+    spread : an int or a float
+        Used to controll the variance in starting age of the worm. If the spread is small, worms will be roughly the same age.
+    size : an int
+        The number of worms in each treatment group.
+    diff : an int or a float
+        The difference in means between treatment groups. (UNKNOWN in real life)
+    reps : an int
+        The number of replicates to simulate.
+    rng : None, an int, a numpy SeedSequence, a numpy Generator or WormStreams (default value = None)
+        The seed of the streams used to create the worms. None uses fresh entropy.
+    first : an int (default value = 0)
+        The number of the first replicate. Replicate i of a seed always has the same worms,
+        so a range of replicates can be simulated on its own (replicate 0 is the same as simulate).
+    groups : None, a list or a dictionary (default value = None)
+        The food concentrations and mean molt ages of the treatment groups (see group_means). None uses CONCENTRATIONS.
+    
+    Returns
+    -------
+    mid_bin : a list of integers or floats
+        The common counting times, covering the bins of every replicate.
+    counts : a numpy array of integers with shape (reps, groups, len(mid_bin))
+        The number of worms of each treatment group of each replicate counted in each bin.
+    """
+    
+    streams = rng if isinstance(rng, WormStreams) else WormStreams(rng)
+    means = group_means(diff, groups)[1]
+    shape = (reps, len(means), size)
+    
+    age = spread*streams.uniform(first, shape)
+    molt_age = means[:, None] + Worm.sd*streams.normal(first, shape)
+    
+    return count_batch(molt_age - age, hour)
+
+
+def batch_p_values(hour, spread, size, diff, reps, rng=None, chunk=None, first=0, groups=None):
+    """ Find the one-tailed p values of many replicates, simulating them in chunks to bound the memory used.
+    The p values of a seed are bit-identical for any chunk size.
+    
+    Parameters
+    ----------
+    hour : an int or a float
+        This represents the frequency that data are collected. (ie worms counted ____ times per hour)
+    spread : an int or a float
+        Used to controll the variance in starting age of the worm. If the spread is small, worms will be roughly the same age.
+    size : an int
+        The number of worms in each treatment group.
+    diff : an int or a float
+        The difference in means between treatment groups. (UNKNOWN in real life)
+    reps : an int
+        The number of replicates to simulate.
+    rng : None, an int, a numpy SeedSequence, a numpy Generator or WormStreams (default value = None)
+        The seed of the streams used to create the worms. None uses fresh entropy.
+    chunk : None or an int (default value = None)
+        The number of replicates simulated at once. None keeps each chunk to about 2 million worms.
+    first : an int (default value = 0)
+        The number of the first replicate, so a range of replicates can be run on its own (e.g. by one worker).
+    groups : None, a list or a dictionary (default value = None)
+        The food concentrations and mean molt ages of the treatment groups (see group_means). None uses CONCENTRATIONS.
+    
+    Returns
+    -------
+    p_values : a numpy array of floats with shape (reps, groups - 1)
+        The one-tailed p values of each neighbouring pair of treatment groups in each replicate.
+    """
+    
+    streams = rng if isinstance(rng, WormStreams) else WormStreams(rng)
+    n_groups = len(group_means(diff, groups)[0])
+    if chunk is None:
+        chunk = max(1, 2000000//(n_groups*size))
+    
+    p_values = np.empty((reps, n_groups - 1))
+    for start in range(0, reps, chunk):
+        n = min(chunk, reps - start)
+        p_values[start:start + n] = find_p_values(*simulate_batch(hour, spread, size, diff, n, streams, first + start, groups))
+    
+    return p_values
+
+
+def simulate_stream(hour, spread, size, diff, rng=None, chunk=None, groups=None):
+    """ Simulate one run in chunks of worms, so the memory used does not grow with size (e.g. 10^9 worms).
+    Each chunk is counted into a fixed grid of bins and into running moments, then thrown away.
+    Gives the same counts as simulate for the same seed, for any chunk size.
+    
+    Parameters
+    ----------
+    hour : an int or a float
+        This represents the frequency that data are collected. (ie worms counted ____ times per hour)
+    spread : an int or a float
+        Used to controll the variance in starting age of the worm. If the spread is small, worms will be roughly the same age.
+    size : an int
+        The number of worms in each treatment group.
+    diff : an int or a float
+        The difference in means between treatment groups. (UNKNOWN in real life)
+    rng : None, an int, a numpy SeedSequence, a numpy Generator or WormStreams (default value = None)
+        The seed of the streams used to create the worms. None uses fresh entropy.
+    chunk : None or an int (default value = None)
+        The number of worms created at once. None uses 1 million.
+    groups : None, a list or a dictionary (default value = None)
+        The food concentrations and mean molt ages of the treatment groups (see group_means). None uses CONCENTRATIONS.
+    
+    Returns
+    -------
+    mid_bin : a list of integers or floats
+        Worms will be counted at each hour indicated in this list, from small to big as in simulate.
+    counts : a numpy array of integers with shape (groups, len(mid_bin))
+        The number of worms of each treatment group counted in each bin.
+    molt_stats : a tuple of three numpy arrays of floats with shape (groups,)
+        The number, mean and variance (n - 1 in the denominator) of the molt times of each treatment group.
+    """
+    
+    streams = rng if isinstance(rng, WormStreams) else WormStreams(rng)
+    means = group_means(diff, groups)[1]
+    if chunk is None:
+        chunk = 1000000
+    
+    # a fixed grid of counting times, wide enough that a worm outside of it is practically impossible (12 sd),
+    # so bins never need to move while the worms are streamed
+    plan = bin_plan(hour, int(np.floor((means.min() - spread - 12*Worm.sd)/hour)),
+                    int(np.ceil((means.max() + 12*Worm.sd)/hour)))
+    edges = plan.edges
+    hist = np.zeros(len(means)*(len(edges) + 1), dtype=np.int64)
+    
+    # running smallest and largest molt time, and the running moments of each group
+    low, high = np.inf, -np.inf
+    n = np.zeros(len(means))
+    mean = np.zeros(len(means))
+    m2 = np.zeros(len(means))
+    
+    for start in range(0, len(means)*size, chunk):
+        count = min(chunk, len(means)*size - start)
+        # worms are numbered group after group as in Cohort, and worm i uses number i of each stream
+        group = np.arange(start, start + count)//size
+        age = spread*streams.uniform(start, (count, 1))[:, 0]
+        molt = means[group] + Worm.sd*streams.normal(start, (count, 1))[:, 0] - age
+        
+        low = min(low, molt.min())
+        high = max(high, molt.max())
+        # the number of edges <= each molt time, as a histogram for each group
+        place = np.searchsorted(edges, molt, side="right")
+        hist += np.bincount(group*(len(edges) + 1) + place, minlength=len(hist))
+        
+        # combine the moments of the chunk with the running moments (Chan et al.)
+        chunk_n = np.bincount(group, minlength=len(means)).astype(float)
+        with np.errstate(invalid="ignore"):
+            chunk_mean = np.bincount(group, molt, minlength=len(means))/chunk_n
+        chunk_m2 = np.bincount(group, (molt - chunk_mean[group])**2, minlength=len(means))
+        total = n + chunk_n
+        used = chunk_n > 0
+        delta = chunk_mean[used] - mean[used]
+        mean[used] += delta*chunk_n[used]/total[used]
+        m2[used] += chunk_m2[used] + delta**2*n[used]*chunk_n[used]/total[used]
+        n = total
+    
+    # keep the bins from small to big, exactly as find_small, find_big and find_mid_bin would from every molt time
+    first, last = find_step_range(low, high, hour)
+    if first < plan.first or last > plan.last:
+        raise ValueError("a molt time fell outside of the grid of bins")
+    window = plan.window(first, last)
+    below = np.cumsum(hist.reshape(len(means), len(edges) + 1), axis=1)
+    
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var = m2/(n - 1)
+    
+    return plan.mid_bin(first, last), below[:, plan.hi[window]] - below[:, plan.lo[window]], (n, mean, var)
+
+
+def make_plot(mid_bin, *worms, labels=None, ax=None):
     """ Make a density plot that shows the fraction of worms glowing over time.
     
     Parameters
     ----------
     mid_bin : a list of integers or floats
         Worms will be counted at each hour indicated in this list.
-    worms0 : a list of floats (first treatment group)
-        Each list from the sort_worm function replaced by a float that represents the fraction molting.
-    worms1 : a list of floats (second treatment group)
-        Each list from the sort_worm function replaced by a float that represents the fraction molting.
-    worms2 : a list of floats (third treatment group)
-        Each list from the sort_worm function replaced by a float that represents the fraction molting.
-    worms3 : a list of floats (fourth treatment group)
+    worms : lists of floats (one for each treatment group, e.g. make_plot(mid_bin, worms0, worms1, worms2, worms3))
         Each list from the sort_worm function replaced by a float that represents the fraction molting.
+    labels : None or a list (default value = None)
+        The food concentration of each treatment group. None uses CONCENTRATIONS for four groups.
+    ax : None or a matplotlib Axes (default value = None)
+        The axes to draw on (e.g. from plotting.offscreen_figure). None uses the current pyplot axes.
     """
     
-    # plot four lines on top of each other
-    plt.plot(mid_bin, worms0, color="blue")
-    plt.plot(mid_bin, worms1, color="orange")
-    plt.plot(mid_bin, worms2, color="green")
-    plt.plot(mid_bin, worms3, color="red")
+    # matplotlib is only imported when a plot is made, so headless runs never load it
+    import matplotlib
+    from plotting import draw_curves
+    
+    if ax is None:
+        import matplotlib.pyplot as plt
+        ax = plt.gca()
+    if labels is None:
+        labels = CONCENTRATIONS if len(worms) == len(CONCENTRATIONS) else ["group " + str(i) for i in range(len(worms))]
+    # the usual four colors, or evenly spaced colors from a colormap for a dose-response series
+    colors = COLORS if len(worms) <= len(COLORS) else matplotlib.colormaps["viridis"](np.linspace(0, 1, len(worms)))
+    
+    # plot every treatment group as one collection of lines
+    handles = draw_curves(ax, mid_bin, worms, colors[:len(worms)], labels)[2]
     # add title and axes labels
-    plt.suptitle("Unsynchronized Worms")
-    plt.xlabel("Time in Hours")
-    plt.ylabel("Fraction Glowing")
+    ax.figure.suptitle("Unsynchronized Worms")
+    ax.set_xlabel("Time in Hours")
+    ax.set_ylabel("Fraction Glowing")
     # add a legend to identify treatment groups
-    plt.legend([mp.Circle((0.5, 0.5), radius=0.25, facecolor="blue", edgecolor="none"),
-                mp.Circle((0.5, 0.5), radius=0.25, facecolor="orange", edgecolor="none"),
-                mp.Circle((0.5, 0.5), radius=0.25, facecolor="green", edgecolor="none"),
-                mp.Circle((0.5, 0.5), radius=0.25, facecolor="red", edgecolor="none")],
-               ["6 mg/mL", "4.8 mg/mL", "3.6 mg/mL", "2.4 mg/mL"])
+    ax.legend(handles=handles)
     
     
-def run(hour=1, spread=8, size=50, diff=1):
-    """ String all the functions together to run the code with a single master function.
+def simulate(hour, spread, size, diff, rng=None, groups=None):
+    """ Run the simulation from creating the groups to counting the worms in each bin, without printing or plotting.
     
     Parameters
     ----------
-    hour : an int or a float (default value = 1)
+    hour : an int or a float
         This represents the frequency that data are collected. (ie worms counted ____ times per hour)
-    spread : an int or a float (default value = 8)
+    spread : an int or a float
         Used to controll the variance in starting age of the worm. If the spread is small, worms will be roughly the same age.
-    size : an int (default value = 50)
+    size : an int
         The number of worms in each treatment group.
     diff : an int or a float
         The difference in means between treatment groups. (UNKNOWN in real life)
+    rng : None, an int, a numpy SeedSequence or a numpy Generator (default value = None)
+        The seed or generator used to create the worms. None uses fresh entropy.
+    groups : None, a list or a dictionary (default value = None)
+        The food concentrations and mean molt ages of the treatment groups (see group_means). None uses CONCENTRATIONS.
+    
+    Returns
+    -------
+    mid_bin : a list of integers or floats
+        Worms will be counted at each hour indicated in this list.
+    counts : a numpy array of integers with shape (groups, len(mid_bin))
+        The number of worms of each treatment group counted in each bin.
     """
     
-    # create the 4 treatment groups using the Class Worm
-    worms = create_groups(spread, diff, size)    
+    # create the treatment groups as arrays of ages and molt ages
+    with stage("create_groups"):
+        worms = create_groups(spread, diff, size, rng, groups)
     
     # determine when each worm molts by molt_age minus current age
-    molt = find_molt(size, worms)
+    with stage("find_molt"):
+        molt = find_molt(size, worms)
     
-    # find the smallest of the molting times and round down to the nearest hour
-    small = find_small(molt, hour)
+    with stage("binning"):
+        # find the smallest and largest molting times, rounded to the nearest hour (as find_small and find_big do)
+        first, last = find_step_range(min(np.min(i) for i in molt), max(np.max(i) for i in molt), hour)
+        
+        # reuse the bins (3 hours wide for each time counted) of any earlier run with the same counting times
+        plan = bin_plan(hour, int(first), int(last))
     
-    # find the largest of the molting times and round up to the nearest hour
-    big = find_big(molt, hour)
+    # count the worms of every treatment group that fall into each bin based on when they molt, in one pass
+    with stage("count_worm"):
+        counts = plan.count(molt)
     
-    # determine when worms will be counted (ie the setup for creating the bins)
-    mid_bin = find_mid_bin(small, big, hour)
+    return plan.mid_bin(), counts
+
+
+def find_p_values(mid_bin, counts):
+    """ Find the one-tailed p values between each pairing of the closest treatment groups (ie 1&2, 2&3, 3&4).
     
-    # create bins that are 3 hours wide for each time counted
-    bins = create_bin(mid_bin)
+    Parameters
+    ----------
+    mid_bin : a list of integers or floats
+        Worms will be counted at each hour indicated in this list.
+    counts : a numpy array of integers with shape (..., groups, len(mid_bin))
+        The number of worms of each treatment group counted in each bin.
     
-    # determine worms that fall into each bin based on when they molt
-    # repeat for each of the 4 treatment groups separately
-    sorted_worms0 = sort_worm(0, bins, molt) 
-    sorted_worms1 = sort_worm(1, bins, molt)
-    sorted_worms2 = sort_worm(2, bins, molt)
-    sorted_worms3 = sort_worm(3, bins, molt)
+    Returns
+    -------
+    p_values : a numpy array of floats with shape (..., groups - 1)
+        The one-tailed p value of each neighbouring pair of treatment groups.
+    """
     
-    # adjust groupings so they contain realistic data, ie mid_bin times not exact molting times
-    # repeat for each of the 4 treatment groups separately
-    flat_worm0 = fix_data(sorted_worms0, mid_bin)
-    flat_worm1 = fix_data(sorted_worms1, mid_bin)
-    flat_worm2 = fix_data(sorted_worms2, mid_bin)
-    flat_worm3 = fix_data(sorted_worms3, mid_bin)
+    counts = np.asarray(counts)
+    # divide by 2 to make the p value for a one-sided t test
+    return ttest_counts(mid_bin, counts[..., :-1, :], mid_bin, counts[..., 1:, :])[1]/2
+
+
+def molt_cdf(t, mean, spread, sd=Worm.sd):
+    """ Find the probability that a worm molts by time t, when its molt time is Normal(mean, sd) minus Uniform(0, spread).
     
-    # prints one-tailed p values and significance between flat_worm data from the treatment groups
-    # repeat for each pairing of the closest treatment groups (ie 1&2, 2&3, 3&4)
-    stats_test(flat_worm0, flat_worm1)
-    stats_test(flat_worm1, flat_worm2)
-    stats_test(flat_worm2, flat_worm3)
+    Parameters
+    ----------
+    t : a float or a numpy array of floats
+        The times (in hours) at which to find the probability.
+    mean : a float or a numpy array of floats
+        The mean molt age of the worm's treatment group.
+    spread : an int or a float
+        Used to controll the variance in starting age of the worm. If the spread is small, worms will be roughly the same age.
+    sd : an int or a float (default value = Worm.sd)
+        Standard deviation of the molt age.
+    
+    Returns
+    -------
+    cdf : a float or a numpy array of floats
+        The probability that the molt time is less than or equal to t.
+    """
+    
+    from scipy.special import ndtr
+    
+    z = (np.asarray(t, dtype=float) - mean)/sd
+    if spread == 0:
+        return ndtr(z)
+    
+    # averaging the normal CDF over the uniform age uses the antiderivative x*ndtr(x) + pdf(x)
+    def antiderivative(x):
+        return x*ndtr(x) + np.exp(-x**2/2)/np.sqrt(2*np.pi)
     
-    # determine the percentage of worms molting at each time
-    # repeat for each of the 4 treatment groups separately
-    worms0 = find_density(sorted_worms0, size)
-    worms1 = find_density(sorted_worms1, size)
-    worms2 = find_density(sorted_worms2, size)
-    worms3 = find_density(sorted_worms3, size)
+    return sd/spread*(antiderivative(z + spread/sd) - antiderivative(z))
+
+
+def expected_density(mid_bin, spread, diff, groups=None):
+    """ Find the expected fraction of worms molting at each time, straight from the molt time distribution.
+    
+    Parameters
+    ----------
+    mid_bin : a list of integers or floats
+        Worms will be counted at each hour indicated in this list.
+    spread : an int or a float
+        Used to controll the variance in starting age of the worm. If the spread is small, worms will be roughly the same age.
+    diff : an int or a float
+        The difference in means between treatment groups. (UNKNOWN in real life)
+    groups : None, a list or a dictionary (default value = None)
+        The food concentrations and mean molt ages of the treatment groups (see group_means). None uses CONCENTRATIONS.
+    
+    Returns
+    -------
+    density : a numpy array of floats with shape (groups, len(mid_bin))
+        The probability that a worm of each treatment group molts within 1.5 hours of each counting time.
+    """
+    
+    mid_bin = np.asarray(mid_bin, dtype=float)
+    means = group_means(diff, groups)[1][:, None]
+    
+    return molt_cdf(mid_bin + 1.5, means, spread) - molt_cdf(mid_bin - 1.5, means, spread)
+
+
+def simulate_analytic(hour, spread, size, diff, rng=None, groups=None):
+    """ Simulate the counts in each bin without creating any worms, by drawing multinomial counts from the molt time distribution.
+    The cost grows with the number of bins, not with size.
+    
+    Parameters
+    ----------
+    hour : an int or a float
+        This represents the frequency that data are collected. (ie worms counted ____ times per hour)
+    spread : an int or a float
+        Used to controll the variance in starting age of the worm. If the spread is small, worms will be roughly the same age.
+    size : an int
+        The number of worms in each treatment group.
+    diff : an int or a float
+        The difference in means between treatment groups. (UNKNOWN in real life)
+    rng : None, an int, a numpy SeedSequence or a numpy Generator (default value = None)
+        The seed or generator used to draw the counts. None uses fresh entropy.
+    groups : None, a list or a dictionary (default value = None)
+        The food concentrations and mean molt ages of the treatment groups (see group_means). None uses CONCENTRATIONS.
+    
+    Returns
+    -------
+    mid_bin : a list of integers or floats
+        Worms will be counted at each hour indicated in this list, from small to big as in simulate.
+    counts : a numpy array of integers with shape (groups, len(mid_bin))
+        The number of worms of each treatment group counted in each bin.
+    """
+    
+    rng = get_generator(rng)
+    means = group_means(diff, groups)[1]
+    
+    # a grid of counting times wide enough that a worm outside of it is practically impossible (10 sd)
+    first = int(np.floor((means.min() - spread - 10*Worm.sd)/hour))
+    last = int(np.ceil((means.max() + 10*Worm.sd)/hour))
+    steps = np.arange(first, last + 1)
+    
+    # the bin edges and the multiples of "hour" cut time into small cells
+    # every bin is a run of whole cells, and each cell sits inside one hour step, so find_small and find_big are exact
+    edges = np.unique(np.concatenate([steps*hour - 1.5, steps*hour + 1.5, steps*hour]))
+    cdf = molt_cdf(edges, means[:, None], spread)
+    cells = np.clip(np.diff(cdf, axis=1), 0, None)
+    cell_counts = rng.multinomial(size, cells/cells.sum(axis=1, keepdims=True))
+    
+    # small and big from the first and last cells holding a worm, using the middle of each cell
+    filled = np.nonzero(cell_counts.sum(axis=0))[0]
+    middle = (edges[:-1] + edges[1:])/2
+    small = int(np.floor(middle[filled[0]]/hour))
+    big = int(np.ceil(middle[filled[-1]]/hour))
+    steps = np.arange(small, big + 1)
+    
+    # count each bin as the number of worms in the cells between its start and end edges
+    below = np.concatenate([np.zeros((len(means), 1), dtype=int), np.cumsum(cell_counts, axis=1)], axis=1)
+    lo = np.searchsorted(edges, steps*hour - 1.5)
+    hi = np.searchsorted(edges, steps*hour + 1.5)
+    counts = below[:, hi] - below[:, lo]
+    
+    return (steps*hour).tolist(), counts
+
+
+@dataclass
+class RunResult():
+    """ Stores the results of one run of the simulation, so they can be used without printing or plotting.
+    
+    Instance Attributes
+    -------------------
+    mid_bin : a list of integers or floats
+        Worms will be counted at each hour indicated in this list.
+    densities : a numpy array of floats with shape (groups, len(mid_bin))
+        The fraction of worms of each treatment group molting at each time.
+    n : a numpy array of floats with shape (groups,)
+        The number of counts of each treatment group (a worm can be counted in more than one bin).
+    mean : a numpy array of floats with shape (groups,)
+        The mean counting time of each treatment group, ie the mean of the flat_worm data.
+    sd : a numpy array of floats with shape (groups,)
+        The standard deviation of the counting times of each treatment group.
+    p_values : a numpy array of floats with shape (groups - 1,)
+        The one-tailed p values between each pairing of the closest treatment groups (ie 1&2, 2&3, 3&4).
+    labels : None or a list
+        The food concentration of each treatment group. None means CONCENTRATIONS.
+    """
+    
+    mid_bin: list
+    densities: np.ndarray
+    n: np.ndarray
+    mean: np.ndarray
+    sd: np.ndarray
+    p_values: np.ndarray
+    labels: list = None
+    
+    def print_p_values(self):
+        """ Prints each p value and whether it is significant. """
+        
+        for test in self.p_values:
+            print_p_value(test)
+    
+    def plot(self, ax=None):
+        """ Make a density plot that shows the fraction of worms glowing over time (on ax, or the current pyplot axes). """
+        
+        make_plot(self.mid_bin, *self.densities, labels=self.labels, ax=ax)
+
+
+def simulate_run(hour=1, spread=8, size=50, diff=1, seed=None, method="sample", groups=None):
+    """ Run the whole simulation and return the results, without printing or plotting.
+    
+    Parameters
+    ----------
+    hour : an int or a float (default value = 1)
+        This represents the frequency that data are collected. (ie worms counted ____ times per hour)
+    spread : an int or a float (default value = 8)
+        Used to controll the variance in starting age of the worm. If the spread is small, worms will be roughly the same age.
+    size : an int (default value = 50)
+        The number of worms in each treatment group.
+    diff : an int or a float (default value = 1)
+        The difference in means between treatment groups. (UNKNOWN in real life)
+    seed : None, an int, a numpy SeedSequence or a numpy Generator (default value = None)
+        The seed or generator used to create the worms. None uses fresh entropy.
+    method : "sample", "stream" or "analytic" (default value = "sample")
+        "sample" creates every worm (simulate). "stream" creates the same worms a chunk at a time (simulate_stream),
+        so the memory used stays the same for any size. "analytic" draws the bin counts straight from
+        the molt time distribution (simulate_analytic), which is much faster for a large size.
+    groups : None, a list or a dictionary (default value = None)
+        The food concentrations and mean molt ages of the treatment groups (see group_means),
+        e.g. 10 to 20 concentrations for a dose-response curve. None uses CONCENTRATIONS.
+    
+    Returns
+    -------
+    result : an object of the class RunResult
+        The counting times, densities, summary of the flat_worm data and p values of the run.
+    """
+    
+    if method == "sample":
+        mid_bin, counts = simulate(hour, spread, size, diff, seed, groups)
+    elif method == "stream":
+        with stage("simulate_stream"):
+            mid_bin, counts = simulate_stream(hour, spread, size, diff, seed, groups=groups)[:2]
+    elif method == "analytic":
+        with stage("simulate_analytic"):
+            mid_bin, counts = simulate_analytic(hour, spread, size, diff, seed, groups)
+    else:
+        raise ValueError('method must be "sample", "stream" or "analytic"')
+    
+    # summarize the flat_worm data straight from the counts
+    with stage("t_tests"):
+        n, mean, var = describe_counts(mid_bin, counts)
+        p_values = find_p_values(mid_bin, counts)
+    
+    return RunResult(mid_bin, counts/size, n, mean, np.sqrt(var), p_values, group_means(diff, groups)[0])
+
+
+def run(hour=1, spread=8, size=50, diff=1, seed=None, groups=None):
+    """ String all the functions together to run the code with a single master function.
+    
+    Parameters
+    ----------
+    hour : an int or a float (default value = 1)
+        This represents the frequency that data are collected. (ie worms counted ____ times per hour)
+    spread : an int or a float (default value = 8)
+        Used to controll the variance in starting age of the worm. If the spread is small, worms will be roughly the same age.
+    size : an int (default value = 50)
+        The number of worms in each treatment group.
+    diff : an int or a float
+        The difference in means between treatment groups. (UNKNOWN in real life)
+    seed : None or an int (default value = None)
+        The same seed always gives the same worms. None uses fresh entropy.
+    groups : None, a list or a dictionary (default value = None)
+        The food concentrations and mean molt ages of the treatment groups (see group_means). None uses CONCENTRATIONS.
+    
+    To see where the time goes, run it inside profiling.profile (e.g. "with profile(memory=True) as record: run()"),
+    which records each stage (create_groups, find_molt, binning, count_worm, t_tests, print_p_values and plot).
+    """
+    
+    # create the worms, count them in bins and run the t tests
+    result = simulate_run(hour, spread, size, diff, seed, groups=groups)
+    
+    # prints one-tailed p values and significance between the binned data from the treatment groups
+    # repeat for each pairing of the closest treatment groups (ie 1&2, 2&3, 3&4)
+    with stage("print_p_values"):
+        result.print_p_values()
     
     # make a density plot that shows the fraction of worms glowing over time
-    make_plot(mid_bin, worms0, worms1, worms2, worms3)
-    
\ No newline at end of file
+    with stage("plot"):
+        result.plot()
@@ -0,0 +1,256 @@
+import multiprocessing
+import os
+import numpy as np
+
+
+# matplotlib is only imported inside each function, so importing this file stays fast for worker processes
+
+# the most curves given their own legend entry, since laying out a legend takes longer than drawing every curve
+LEGEND_LIMIT = 24
+
+
+def offscreen_figure(figsize=None, dpi=100):
+    """ Make a figure drawn by Agg that is not tracked by pyplot, so thousands can be made and saved
+    without any window or pyplot state, and each is freed as soon as it is dropped.
+
+    Parameters
+    ----------
+    figsize : None or a tuple of two floats (default value = None)
+        The width and height of the figure in inches. None uses the matplotlib default.
+    dpi : an int (default value = 100)
+        The dots per inch of the figure.
+
+    Returns
+    -------
+    fig : a matplotlib Figure
+    ax : a matplotlib Axes
+        The single set of axes of the figure.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+
+    return fig, fig.add_subplot()
+
+
+def curve_segments(x, curves):
+    """ Turn curves that share their x values into the segments of a LineCollection.
+
+    Parameters
+    ----------
+    x : a list or numpy array of floats
+        The x value of every point.
+    curves : a numpy array of floats with shape (number of curves, len(x))
+        The y values of each curve.
+
+    Returns
+    -------
+    segments : a numpy array of floats with shape (number of curves, len(x), 2)
+    """
+
+    curves = np.asarray(curves, dtype=float)
+    x = np.broadcast_to(np.asarray(x, dtype=float), curves.shape)
+
+    return np.stack([x, curves], axis=-1)
+
+
+def draw_curves(ax, x, curves, colors, labels=None, marker=None, markersize=8, markercolor="0.0"):
+    """ Draw many curves as one LineCollection (and their points as one scatter), instead of one line per curve.
+
+    Parameters
+    ----------
+    ax : a matplotlib Axes
+        The axes to draw on.
+    x : a list or numpy array of floats
+        The x value of every point, shared by all the curves.
+    curves : a numpy array of floats with shape (number of curves, len(x))
+        The y values of each curve.
+    colors : a list of colors
+        The color of each curve.
+    labels : None or a list of strings (default value = None)
+        The legend label of each curve. None gives no legend handles.
+    marker : None or a string (default value = None)
+        The marker drawn at every point (e.g. "."). None draws lines only.
+    markersize : an int or a float (default value = 8)
+        The size of the markers in points.
+    markercolor : a color (default value = "0.0")
+        The color of every marker.
+
+    Returns
+    -------
+    lines : a matplotlib LineCollection
+        Every curve. Its data can be replaced later with set_segments(curve_segments(x, curves)).
+    points : a matplotlib PathCollection or None
+        Every marker, or None when marker is None. Its data can be replaced later with set_offsets.
+    handles : a list of matplotlib Line2D
+        One legend handle for each label (e.g. ax.legend(handles=handles)).
+    """
+    from matplotlib.collections import LineCollection
+
+    segments = curve_segments(x, curves)
+    lines = LineCollection(segments, colors=list(colors))
+    ax.add_collection(lines)
+    points = None
+    if marker is not None:
+        # every point of every curve in one scatter, drawn above the lines
+        points = ax.scatter(segments[..., 0].ravel(), segments[..., 1].ravel(), s=markersize**2, marker=marker,
+                            color=markercolor, zorder=3)
+    ax.autoscale_view()
+
+    handles = [] if labels is None else curve_handles(colors, labels, marker, markersize, markercolor)
+
+    return lines, points, handles
+
+
+def curve_handles(colors, labels, marker=None, markersize=8, markercolor="0.0"):
+    """ Make legend handles that look like the curves of draw_curves, without adding any artists to the axes.
+
+    Parameters
+    ----------
+    colors : a list of colors
+        The color of each curve.
+    labels : a list of strings
+        The legend label of each curve.
+    marker, markersize, markercolor : see draw_curves
+
+    Returns
+    -------
+    handles : a list of matplotlib Line2D
+    """
+    from matplotlib.lines import Line2D
+
+    return [Line2D([], [], color=color, marker=marker, ms=markersize, mfc=markercolor, mec=markercolor,
+                   label=str(label)) for color, label in zip(colors, labels)]
+
+
+def curve_key(ax, handles, values, cmap, title=None):
+    """ Add a legend with one entry per curve, or a colorbar of the values behind the colors when there are
+    more than LEGEND_LIMIT curves.
+
+    Parameters
+    ----------
+    ax : a matplotlib Axes
+        The axes to add the key to.
+    handles : a list of matplotlib Line2D
+        The legend handle of each curve (from draw_curves or curve_handles).
+    values : a numpy array of floats
+        The value that each color was taken from (e.g. the concentration of each well).
+    cmap : a matplotlib Colormap
+        The colormap the colors were taken from, spread from the smallest to the largest value.
+    title : None or a string (default value = None)
+        The title of the legend or the label of the colorbar.
+
+    Returns
+    -------
+    key : a matplotlib Legend or Colorbar
+    """
+    from matplotlib.cm import ScalarMappable
+    from matplotlib.colors import Normalize
+
+    if len(handles) <= LEGEND_LIMIT:
+        return ax.legend(handles=handles, title=title, bbox_to_anchor=(1,1))
+
+    values = np.asarray(values, dtype=float)
+    mappable = ScalarMappable(Normalize(values.min(), values.max()), cmap)
+
+    return ax.figure.colorbar(mappable, ax=ax, label=title)
+
+
+def draw_points(ax, x, y, colors, **kwargs):
+    """ Draw colored points with one scatter for each color, instead of one plot call for each point.
+
+    Parameters
+    ----------
+    ax : a matplotlib Axes
+        The axes to draw on.
+    x, y : numpy arrays of floats
+        The position of every point.
+    colors : a numpy array of strings
+        The color of every point (e.g. from find_quadrant).
+    kwargs : keyword arguments
+        Passed on to every scatter (e.g. s=40).
+
+    Returns
+    -------
+    points : a dictionary
+        The matplotlib PathCollection of each color.
+    """
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    colors = np.asarray(colors)
+
+    return {str(color): ax.scatter(x[colors == color], y[colors == color], color=str(color), **kwargs)
+            for color in np.unique(colors)}
+
+
+def _export_graph(args):
+    # draw and save the graph of one experiment in the worker process
+    exp, folder, data_dir, cache_dir, form, dpi = args
+    from data_analysis import make_graph
+
+    fig, ax = offscreen_figure(dpi=dpi)
+    make_graph(exp, data_dir, cache_dir, ax=ax)
+    path = os.path.join(folder, exp + "_graph." + form)
+    fig.savefig(path, bbox_inches="tight")
+
+    return path
+
+
+def export_archive(exp_list, folder, data_dir=".", cache_dir=None, form="png", dpi=100, stats=True, processes=1,
+                   method="t", resamples=10000, seed=None):
+    """ Save the figures of a whole archive of experiments to files, drawn off-screen by Agg.
+    Each experiment gets the graph from make_graph, and the archive gets the plot from stats_test.
+
+    Parameters
+    ----------
+    exp_list : a list of strings
+        The experiments to draw (e.g. ["exp_1", "exp_4"]).
+    folder : a string
+        The folder the files are saved in (made if it does not exist).
+    data_dir : string (default value = ".")
+        The folder where the experimental data and setup data are stored.
+    cache_dir : string or None (default value = None)
+        The folder where parsed experiments are cached. None uses a folder called ".cache" inside data_dir.
+    form : a string (default value = "png")
+        The file format of the figures (e.g. "png", "pdf" or "svg").
+    dpi : an int (default value = 100)
+        The dots per inch of the figures.
+    stats : a boolean (default value = True)
+        If True, also save the stats_test plot of every experiment as "stats_test.<form>".
+    processes : None or an int (default value = 1)
+        The number of worker processes. None uses every core.
+    method : a string (default value = "t")
+        "t", "permutation" or "bootstrap" (see data_analysis.pair_table).
+    resamples : an int (default value = 10000)
+        The number of resamples drawn for each pair when method is "permutation" or "bootstrap".
+    seed : None, an int, a numpy SeedSequence or a numpy Generator (default value = None)
+        The seed of the resamples.
+
+    Returns
+    -------
+    paths : a list of strings
+        The files saved, in the order of exp_list with the stats_test plot last.
+    """
+
+    os.makedirs(folder, exist_ok=True)
+    tasks = [(exp, folder, data_dir, cache_dir, form, dpi) for exp in exp_list]
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes == 1 or len(tasks) < 2:
+        paths = list(map(_export_graph, tasks))
+    else:
+        with multiprocessing.Pool(min(processes, len(tasks))) as pool:
+            paths = pool.map(_export_graph, tasks)
+
+    if stats:
+        from data_analysis import stats_test
+
+        fig, ax = offscreen_figure(dpi=dpi)
+        stats_test(exp_list, False, data_dir, cache_dir, processes, method, resamples, seed, ax=ax)
+        paths.append(os.path.join(folder, "stats_test." + form))
+        fig.savefig(paths[-1], bbox_inches="tight")
+
+    return paths
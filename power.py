@@ -0,0 +1,115 @@
+import multiprocessing
+import numpy as np
+from module import batch_p_values
+from seeding import seed_sequence
+
+
+def pair_names(groups):
+    """ Name the neighbouring treatment groups that are compared, in the order of the p values.
+
+    Parameters
+    ----------
+    groups : an int
+        The number of treatment groups.
+
+    Returns
+    -------
+    pairs : a list of strings
+        e.g. ["0-1", "1-2", "2-3"] for four groups.
+    """
+
+    return [str(i) + "-" + str(i + 1) for i in range(groups - 1)]
+
+
+# the neighbouring pairs of the four default treatment groups
+PAIRS = pair_names(4)
+
+
+def _replicate_range(args):
+    # run replicates first to first + reps - 1 of the seed in the worker process (Pool.map only passes one argument)
+    hour, spread, size, diff, reps, seed, first, groups = args
+    return batch_p_values(hour, spread, size, diff, reps, seed, first=first, groups=groups)
+
+
+def power_p_values(hour=1, spread=8, size=50, diff=1, reps=1000, seed=None, processes=None, groups=None):
+    """ Run many independent replicates of the simulation across a pool of processes.
+
+    Parameters
+    ----------
+    hour : an int or a float (default value = 1)
+        This represents the frequency that data are collected. (ie worms counted ____ times per hour)
+    spread : an int or a float (default value = 8)
+        Used to controll the variance in starting age of the worm. If the spread is small, worms will be roughly the same age.
+    size : an int (default value = 50)
+        The number of worms in each treatment group.
+    diff : an int or a float (default value = 1)
+        The difference in means between treatment groups. (UNKNOWN in real life)
+    reps : an int (default value = 1000)
+        The number of replicates to run.
+    seed : None, an int or a numpy SeedSequence (default value = None)
+        The master seed. Each replicate has its own part of the seed's streams, so the results are
+        bit-identical for any number of processes.
+    processes : None or an int (default value = None)
+        The number of worker processes. None uses every core, and 1 runs everything in this process.
+    groups : None, a list or a dictionary (default value = None)
+        The food concentrations and mean molt ages of the treatment groups (see module.group_means).
+
+    Returns
+    -------
+    p_values : a numpy array of floats with shape (reps, groups - 1)
+        The one-tailed p values of each replicate, in the order of pair_names.
+    """
+
+    # every replicate owns a fixed part of the seed's streams, so the results only depend on the seed,
+    # not on how the replicates are shared between processes
+    seed = seed_sequence(seed)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    if processes == 1 or reps < 2:
+        return _replicate_range((hour, spread, size, diff, reps, seed, 0, groups))
+
+    # hand each process a few ranges of neighbouring replicates, then put them back in order
+    chunks = [i for i in np.array_split(np.arange(reps), min(reps, 4*processes)) if len(i)]
+    tasks = [(hour, spread, size, diff, len(i), seed, int(i[0]), groups) for i in chunks]
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.map(_replicate_range, tasks)
+
+    return np.concatenate(results)
+
+
+def power_analysis(hour=1, spread=8, size=50, diff=1, reps=1000, alpha=0.05, seed=None, processes=None, groups=None):
+    """ Estimate the statistical power of the experiment as the fraction of replicates with a significant t test.
+
+    Parameters
+    ----------
+    hour : an int or a float (default value = 1)
+        This represents the frequency that data are collected. (ie worms counted ____ times per hour)
+    spread : an int or a float (default value = 8)
+        Used to controll the variance in starting age of the worm. If the spread is small, worms will be roughly the same age.
+    size : an int (default value = 50)
+        The number of worms in each treatment group.
+    diff : an int or a float (default value = 1)
+        The difference in means between treatment groups. (UNKNOWN in real life)
+    reps : an int (default value = 1000)
+        The number of replicates to run.
+    alpha : a float (default value = 0.05)
+        The significance threshold for the one-tailed p values.
+    seed : None or an int (default value = None)
+        The master seed, so the same seed always gives the same power.
+    processes : None or an int (default value = None)
+        The number of worker processes. None uses every core, and 1 runs everything in this process.
+    groups : None, a list or a dictionary (default value = None)
+        The food concentrations and mean molt ages of the treatment groups (see module.group_means).
+
+    Returns
+    -------
+    power : a numpy array of floats with shape (groups - 1,)
+        The rejection rate of each neighbouring pair of treatment groups, in the order of pair_names.
+    """
+
+    p_values = power_p_values(hour, spread, size, diff, reps, seed, processes, groups)
+
+    # a nan p value (too few worms to test) counts as not significant
+    with np.errstate(invalid="ignore"):
+        return np.mean(p_values < alpha, axis=0)
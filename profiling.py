@@ -0,0 +1,211 @@
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+
+# returned by stage when nothing is being recorded, so an instrumented function only pays for one lookup
+_NULL = nullcontext()
+
+# the record that stages are added to, or None when profiling is off
+_active = {"record": None}
+
+
+class StageRecord():
+    """ Stores the wall time, memory and number of calls of each stage of the pipeline (e.g. "create_groups", "t_tests").
+    Stages can be nested, and the time and memory of a stage include the stages run inside it.
+
+    Instance Attributes
+    -------------------
+    memory : a boolean
+        If True, the memory of each stage is traced with tracemalloc.
+    stages : a dictionary of dictionaries
+        For each stage name, "calls", "seconds" (the total wall time), "peak_bytes" (the largest rise in traced
+        memory during any one call), "net_bytes" (the total memory still held after the calls) and "net_blocks"
+        (the total number of memory blocks still allocated by the interpreter after the calls).
+        The memory values are 0 when memory is False.
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.stages = {}
+        # the stages that have started but not finished, innermost last
+        self._open = []
+
+    def add(self, name, calls=1, seconds=0.0, peak_bytes=0, net_bytes=0, net_blocks=0):
+        """ Add calls of a stage to the record.
+
+        Parameters
+        ----------
+        name : a string
+            The name of the stage.
+        calls : an int (default value = 1)
+            The number of calls to add.
+        seconds : a float (default value = 0.0)
+            The wall time of the calls.
+        peak_bytes : an int (default value = 0)
+            The largest rise in traced memory during one of the calls.
+        net_bytes : an int (default value = 0)
+            The memory still held after the calls.
+        net_blocks : an int (default value = 0)
+            The number of allocated memory blocks still held after the calls.
+        """
+
+        found = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0, "peak_bytes": 0, "net_bytes": 0,
+                                              "net_blocks": 0})
+        found["calls"] += calls
+        found["seconds"] += seconds
+        found["peak_bytes"] = max(found["peak_bytes"], peak_bytes)
+        found["net_bytes"] += net_bytes
+        found["net_blocks"] += net_blocks
+
+    def merge(self, other):
+        """ Add every stage of another record to this one (e.g. to total the runs of a sweep).
+
+        Parameters
+        ----------
+        other : an object of the class StageRecord or a dictionary from to_dict
+            The record to add.
+
+        Returns
+        -------
+        self : an object of the class StageRecord
+        """
+
+        stages = other.stages if isinstance(other, StageRecord) else other
+        for name, found in stages.items():
+            self.add(name, **found)
+
+        return self
+
+    def to_dict(self):
+        """ Return the stages as a dictionary that can be saved as JSON. """
+
+        return {name: dict(found) for name, found in self.stages.items()}
+
+    def dump(self, path):
+        """ Save the stages as a JSON file.
+
+        Parameters
+        ----------
+        path : a string
+            The name of the file.
+        """
+
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        """ Read a record saved with dump.
+
+        Parameters
+        ----------
+        path : a string
+            The name of the file.
+
+        Returns
+        -------
+        record : an object of the class StageRecord
+        """
+
+        with open(path) as f:
+            return cls().merge(json.load(f))
+
+
+class _Stage():
+    # times one call of a stage and adds it to the record when it finishes
+    __slots__ = ["record", "name", "start", "start_bytes", "start_blocks", "peak"]
+
+    def __init__(self, record, name):
+        self.record = record
+        self.name = name
+
+    def __enter__(self):
+        if self.record.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # the stages around this one keep the peak reached so far before it is reset
+            for outer in self.record._open:
+                outer.peak = max(outer.peak, peak)
+            tracemalloc.reset_peak()
+            self.start_bytes = self.peak = current
+            # a running count kept by the interpreter, so reading it costs nothing next to a tracemalloc snapshot
+            self.start_blocks = sys.getallocatedblocks()
+            self.record._open.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        peak_bytes = net_bytes = net_blocks = 0
+        if self.record.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            self.record._open.remove(self)
+            for stage in self.record._open + [self]:
+                stage.peak = max(stage.peak, peak)
+            peak_bytes = self.peak - self.start_bytes
+            net_bytes = current - self.start_bytes
+            net_blocks = sys.getallocatedblocks() - self.start_blocks
+            tracemalloc.reset_peak()
+        self.record.add(self.name, 1, seconds, peak_bytes, net_bytes, net_blocks)
+        return False
+
+
+def stage(name):
+    """ Mark a block of code as a stage of the pipeline, used as "with stage("t_tests"): ...".
+    When profiling is off this returns a shared do-nothing context, so the cost is close to zero.
+
+    Parameters
+    ----------
+    name : a string
+        The name of the stage in the record.
+
+    Returns
+    -------
+    context : a context manager
+    """
+
+    record = _active["record"]
+    if record is None:
+        return _NULL
+
+    return _Stage(record, name)
+
+
+@contextmanager
+def profile(memory=False, record=None):
+    """ Record every stage run inside the with block.
+    e.g. with profile(memory=True) as record:
+             run(1, 8, 50, 1)
+         record.dump("run_profile.json")
+
+    Stages run in other processes (e.g. by a process pool) are not recorded.
+
+    Parameters
+    ----------
+    memory : a boolean (default value = False)
+        If True, also trace the peak and net memory and the net number of allocated blocks of each stage with
+        tracemalloc, which slows the code down.
+    record : None or an object of the class StageRecord (default value = None)
+        A record to keep adding to (e.g. across the points of a sweep). None starts a new one.
+
+    Yields
+    ------
+    record : an object of the class StageRecord
+    """
+
+    if record is None:
+        record = StageRecord(memory)
+    record.memory = memory
+    started = memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    previous = _active["record"]
+    _active["record"] = record
+    try:
+        yield record
+    finally:
+        _active["record"] = previous
+        if started:
+            tracemalloc.stop()
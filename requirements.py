@@ -1,19 +1,169 @@
 # Please run the following imports - Note that required imports are also included within each file
 
 
-# required for the file called module
-import random as rnd
+# required for the file called module (scipy.stats and matplotlib are only imported when they are used)
+from dataclasses import dataclass
+from functools import lru_cache
 from scipy import stats
+from scipy.special import ndtr
 import numpy as np
+import matplotlib
 import matplotlib.pyplot as plt
-import matplotlib.patches as mp
+from freq_stats import describe_counts, ttest_counts
+from profiling import stage
+from seeding import WormStreams, get_generator
+from resample import resample_test
+from plotting import draw_curves
+
+
+# required for the file called seeding (scipy.special is only imported when normal numbers are drawn)
+import os
+import numpy as np
+from scipy.special import ndtri
+
+
+# required for the file called profiling (tracemalloc is only started when memory is traced)
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+
+# required for the file called freq_stats (scipy.special is only imported when a t test runs)
+import numpy as np
+from scipy.special import stdtr
+
+
+# required for the file called resample
+import multiprocessing
+import numpy as np
+from freq_stats import describe_counts, t_statistic
+from seeding import spawn_seeds
+
+
+# required for the file called power
+import multiprocessing
+import numpy as np
+from module import batch_p_values
+from seeding import seed_sequence
+
+
+# required for the file called sweep (pandas is only imported to build the results table)
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import numpy as np
+import pandas as pd
+from module import ENGINE_VERSION
+from power import PAIRS, pair_names, power_p_values
+
+
+# required for the file called glow (pandas and data_analysis are only imported to build the spreadsheet)
+import numpy as np
+import pandas as pd
+from data_analysis import clock_hours
+from module import Worm, molt_cdf
+from seeding import get_generator
+
+
+# required for the file called inference (pandas and data_analysis are only imported to fit lab experiments)
+import hashlib
+import multiprocessing
+import os
+import numpy as np
+import pandas as pd
+from module import molt_cdf
+from data_analysis import load_experiment, find_wells, find_outliers
+
+
+# required for the file called store (pandas is only imported to list the shards as a table)
+import json
+import os
+import numpy as np
+import pandas as pd
+from module import simulate_batch, find_p_values
+from seeding import WormStreams
+
+
+# required for the file called plotting (matplotlib and data_analysis are only imported to draw and save figures)
+import multiprocessing
+import os
+import numpy as np
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
+from matplotlib.cm import ScalarMappable
+from matplotlib.colors import Normalize
+from data_analysis import make_graph, stats_test
+
+
+# required for the file called data_analysis (pandas and matplotlib are only imported when a function runs)
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+import matplotlib
+import matplotlib.pyplot as plt
+import matplotlib.lines as mlines
+from matplotlib.colorbar import Colorbar
+from freq_stats import describe_counts, ttest_stats
+from profiling import stage
+from seeding import spawn_seeds
+from resample import resample_pairs
+from plotting import LEGEND_LIMIT, curve_segments, curve_handles, curve_key, draw_curves, draw_points
+
+
+# required for the file called benchmark (pandas is only imported to write the synthetic spreadsheets)
+import argparse
+import datetime
+import io
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import module
+import data_analysis
+import glow
+from plotting import offscreen_figure
 
 
 # required for the file called test_functions
-from module import find_small, sort_worm
+from module import find_small, find_big, find_mid_bin, create_bin, sort_worm, count_worm, count_batch
+from module import create_groups, find_molt, Worm, simulate, simulate_run, find_p_values
+from module import group_means, count_groups, simulate_stream, bin_plan
+from module import molt_cdf, expected_density, simulate_analytic, simulate_batch, batch_p_values
+from seeding import WormStreams, spawn_seeds
+from freq_stats import ttest_counts
+from power import power_analysis, power_p_values, pair_names
+from sweep import run_sweep, point_key, make_grid
+import sweep
+from profiling import profile, StageRecord
+from glow import glow_counts, simulate_plate, plate_labels
+from inference import fit_experiments
+from store import ResultStore, simulate_to_store
+from resample import resample_test
+from plotting import export_archive, offscreen_figure
+from benchmark import loaded_modules, import_time, run_suite, compare
+from scipy import stats
+import numpy as np
+import os
+import datetime
+import pytest
+import data_analysis
 
 
 # required for the file called Larval_DR_Sim
-from ipywidgets import interact
+from ipywidgets import interact, fixed
 from IPython.core.display import display, HTML
-from module import run
\ No newline at end of file
+from module import run
@@ -0,0 +1,172 @@
+import multiprocessing
+import numpy as np
+from freq_stats import describe_counts, t_statistic
+from seeding import spawn_seeds
+
+
+def _as_counts(counts):
+    # resampling draws whole worms, so the counts must be whole numbers
+    counts = np.asarray(counts)
+    rounded = np.rint(counts).astype(np.int64)
+    if np.any(rounded != counts) or np.any(rounded < 0):
+        raise ValueError("the counts must be whole numbers of at least 0")
+
+    return rounded
+
+
+def _resample_chunk(args):
+    # draw one chunk of resamples in the worker process and return the t statistic of each one
+    method, values, counts_1, counts_2, reps, seed, equal_var, shift = args
+    rng = np.random.default_rng(seed)
+
+    if method == "permutation":
+        # shuffling the labels of the pooled worms is the same as drawing sample A from the pool without replacement
+        pooled = counts_1 + counts_2
+        draw_1 = rng.multivariate_hypergeometric(pooled, int(counts_1.sum()), size=reps)
+        draw_2 = pooled - draw_1
+    else:
+        # each sample is drawn again from its own bins with replacement
+        n_1 = int(counts_1.sum())
+        n_2 = int(counts_2.sum())
+        draw_1 = rng.multinomial(n_1, counts_1/n_1, size=reps)
+        draw_2 = rng.multinomial(n_2, counts_2/n_2, size=reps)
+
+    # every resample is a row, so the statistics of the whole chunk are found at once
+    n_1, mean_1, var_1 = describe_counts(values, draw_1)
+    n_2, mean_2, var_2 = describe_counts(values, draw_2)
+
+    return t_statistic(n_1, mean_1, var_1, n_2, mean_2, var_2, equal_var, shift)[0]
+
+
+def resample_test(values, counts_1, counts_2, method="permutation", resamples=10000, alternative="two-sided",
+                  seed=None, equal_var=True, processes=1, chunk=10000):
+    """ Run a permutation or bootstrap test on the t statistic between two samples stored as (value, count) pairs.
+    The resamples are drawn as arrays of bin counts (chunk rows at a time), so no sample is ever expanded into a list.
+
+    "permutation" pools the worms of both samples and splits them again at random, keeping the size of each sample
+    (a multivariate hypergeometric draw of sample A from the pooled bins). "bootstrap" draws each sample again from
+    its own bins (a multinomial draw), and compares the observed t statistic with the resampled ones centered on the
+    observed difference in means.
+
+    Parameters
+    ----------
+    values : a list or numpy array of floats
+        The distinct values shared by both samples (e.g. mid_bin times or times of data collection).
+    counts_1 : a list or numpy array of integers (sample A)
+        The number of observations at each value of sample A.
+    counts_2 : a list or numpy array of integers (sample B)
+        The number of observations at each value of sample B.
+    method : a string (default value = "permutation")
+        "permutation" or "bootstrap".
+    resamples : an int (default value = 10000)
+        The number of resamples to draw.
+    alternative : a string (default value = "two-sided")
+        "two-sided", "less" (the mean of A is smaller) or "greater" (the mean of A is larger).
+    seed : None, an int, a numpy SeedSequence or a numpy Generator (default value = None)
+        The seed of the resamples. Each chunk has its own child seed, so the p value does not depend on processes.
+    equal_var : a boolean (default value = True)
+        If True, use Student's t statistic. If False, use Welch's t statistic.
+    processes : None or an int (default value = 1)
+        The number of worker processes the chunks are shared between. None uses every core.
+    chunk : an int (default value = 10000)
+        The number of resamples drawn at once, which sets the memory used (about 16*chunk*len(values) bytes).
+
+    Returns
+    -------
+    t : a float
+        The observed t statistic.
+    p : a float
+        The p value, counting the observed split as one of the resamples so it is never 0
+        (nan if either sample has fewer than two observations).
+    """
+
+    if method not in ("permutation", "bootstrap"):
+        raise ValueError("method must be 'permutation' or 'bootstrap', not " + repr(method))
+    if alternative not in ("two-sided", "less", "greater"):
+        raise ValueError("alternative must be 'two-sided', 'less' or 'greater', not " + repr(alternative))
+    values = np.asarray(values, dtype=float)
+    counts_1 = _as_counts(counts_1)
+    counts_2 = _as_counts(counts_2)
+
+    n_1, mean_1, var_1 = describe_counts(values, counts_1)
+    n_2, mean_2, var_2 = describe_counts(values, counts_2)
+    t = float(t_statistic(n_1, mean_1, var_1, n_2, mean_2, var_2, equal_var)[0])
+    if n_1 < 2 or n_2 < 2:
+        return t, np.nan
+
+    # the bootstrap resamples are centered on the observed difference, so they follow the null hypothesis
+    shift = mean_1 - mean_2 if method == "bootstrap" else 0.0
+    sizes = [min(chunk, resamples - start) for start in range(0, resamples, chunk)]
+    tasks = [(method, values, counts_1, counts_2, reps, child, equal_var, shift)
+             for reps, child in zip(sizes, spawn_seeds(seed, len(sizes)))]
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    if processes == 1 or len(tasks) < 2:
+        results = map(_resample_chunk, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(min(processes, len(tasks)))
+        results = pool.imap(_resample_chunk, tasks)
+
+    # only the number of resamples at least as extreme is kept from each chunk
+    extreme = 0
+    try:
+        for found in results:
+            with np.errstate(invalid="ignore"):
+                if alternative == "two-sided":
+                    extreme += int(np.sum(np.abs(found) >= abs(t)))
+                elif alternative == "less":
+                    extreme += int(np.sum(found <= t))
+                else:
+                    extreme += int(np.sum(found >= t))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return t, (extreme + 1)/(resamples + 1)
+
+
+def resample_pairs(groups, times, counts, pairs, method="permutation", resamples=10000, seed=None, equal_var=True,
+                   processes=1, chunk=10000):
+    """ Find resampled two-sided p values for pairs of wells of one experiment.
+
+    Parameters
+    ----------
+    groups : a numpy array
+        The labels of the wells, in the order of the columns of counts.
+    times : a numpy array of floats
+        The time of each count in hours.
+    counts : a numpy array with shape (len(times), len(groups))
+        The number of worms glowing in each well at each time.
+    pairs : a pandas DataFrame
+        The pairs to test, with the columns "well_a" and "well_b" (e.g. from pair_table).
+    method : a string (default value = "permutation")
+        "permutation" or "bootstrap" (see resample_test).
+    resamples : an int (default value = 10000)
+        The number of resamples drawn for each pair.
+    seed : None, an int, a numpy SeedSequence or a numpy Generator (default value = None)
+        The seed of the resamples. Each pair has its own child seed.
+    equal_var : a boolean (default value = True)
+        If True, use Student's t statistic. If False, use Welch's t statistic.
+    processes : None or an int (default value = 1)
+        The number of worker processes used for each pair (see resample_test).
+    chunk : an int (default value = 10000)
+        The number of resamples drawn at once.
+
+    Returns
+    -------
+    p : a numpy array of floats
+        The p value of each row of pairs.
+    """
+
+    column = {label: i for i, label in enumerate(groups)}
+    counts = np.asarray(counts)
+    seeds = spawn_seeds(seed, len(pairs))
+    p = np.empty(len(pairs))
+    for i, (a, b) in enumerate(zip(pairs["well_a"], pairs["well_b"])):
+        p[i] = resample_test(times, counts[:, column[a]], counts[:, column[b]], method, resamples, "two-sided",
+                             seeds[i], equal_var, processes, chunk)[1]
+
+    return p
@@ -0,0 +1,149 @@
+import os
+import numpy as np
+
+
+# the process that created the shared default generator, so forked workers make their own
+_default = {"pid": None, "rng": None}
+
+
+def seed_sequence(seed=None):
+    """ Turn any kind of seed into a numpy SeedSequence, the root of every random stream in the simulation.
+
+    Parameters
+    ----------
+    seed : None, an int, a numpy SeedSequence or a numpy Generator (default value = None)
+        None uses fresh entropy. An int or SeedSequence always gives the same streams.
+        A Generator gives a new child of its seed each time, so repeated calls give new (but reproducible) numbers.
+
+    Returns
+    -------
+    seq : a numpy SeedSequence
+    """
+
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if isinstance(seed, np.random.Generator):
+        return seed.bit_generator.seed_seq.spawn(1)[0]
+
+    return np.random.SeedSequence(seed)
+
+
+def get_generator(seed=None):
+    """ Create a numpy Generator from any kind of seed, or return the Generator that was passed in.
+
+    Parameters
+    ----------
+    seed : None, an int, a numpy SeedSequence or a numpy Generator (default value = None)
+        The seed of the generator. None uses the shared default generator of this process.
+
+    Returns
+    -------
+    rng : a numpy Generator
+    """
+
+    if isinstance(seed, np.random.Generator):
+        return seed
+    if seed is None:
+        return default_generator()
+
+    return np.random.Generator(np.random.PCG64(seed_sequence(seed)))
+
+
+def default_generator():
+    """ Return the shared Generator used when no seed is given.
+    A new one is made from fresh entropy in every process, so forked workers never repeat each other's numbers.
+
+    Returns
+    -------
+    rng : a numpy Generator
+    """
+
+    if _default["pid"] != os.getpid():
+        _default["pid"] = os.getpid()
+        _default["rng"] = np.random.default_rng()
+
+    return _default["rng"]
+
+
+def spawn_seeds(seed, n):
+    """ Split a seed into independent child seeds (e.g. one per replicate or one per worker process).
+
+    Parameters
+    ----------
+    seed : None, an int, a numpy SeedSequence or a numpy Generator
+        The parent seed.
+    n : an int
+        The number of children.
+
+    Returns
+    -------
+    seeds : a list of numpy SeedSequences
+    """
+
+    return seed_sequence(seed).spawn(n)
+
+
+class WormStreams():
+    """ Random streams where every replicate owns a fixed block of numbers, so any range of replicates
+    can be drawn on its own and the results do not depend on the worker count or chunk size.
+
+    There are two PCG64 streams (one for ages, one for molt age noise). Replicate r with n worms uses numbers
+    r*n to (r + 1)*n - 1 of each stream, reached with PCG64.advance. Every number takes exactly one 64-bit draw:
+    uniforms use the same formula as Generator.random, and normals use the inverse normal CDF.
+
+    Instance Attributes
+    -------------------
+    seed : a numpy SeedSequence
+        The root of both streams.
+    """
+
+    def __init__(self, seed=None):
+        self.seed = seed_sequence(seed)
+        # the children are made directly (not with spawn) so the same seed always gives the same two streams
+        self._children = [np.random.SeedSequence(self.seed.entropy, spawn_key=self.seed.spawn_key + (i,),
+                                                 pool_size=self.seed.pool_size) for i in range(2)]
+
+    def _raw(self, stream, start, count):
+        bit_generator = np.random.PCG64(self._children[stream])
+        bit_generator.advance(start)
+        # the top 53 bits of each draw make one float, as in Generator.random
+        return (bit_generator.random_raw(count) >> np.uint64(11)).astype(float)
+
+    def uniform(self, first, shape):
+        """ Draw uniform numbers in [0, 1) for replicates first, first + 1, ... as an array of the given shape.
+
+        Parameters
+        ----------
+        first : an int
+            The replicate the first row belongs to.
+        shape : a tuple of ints
+            (replicates, ...), where the numbers after the first make up one replicate.
+
+        Returns
+        -------
+        u : a numpy array of floats with the given shape
+        """
+
+        per = int(np.prod(shape[1:]))
+        return (self._raw(0, first*per, shape[0]*per)*2.0**-53).reshape(shape)
+
+    def normal(self, first, shape):
+        """ Draw standard normal numbers for replicates first, first + 1, ... as an array of the given shape.
+
+        Parameters
+        ----------
+        first : an int
+            The replicate the first row belongs to.
+        shape : a tuple of ints
+            (replicates, ...), where the numbers after the first make up one replicate.
+
+        Returns
+        -------
+        z : a numpy array of floats with the given shape
+        """
+
+        from scipy.special import ndtri
+
+        per = int(np.prod(shape[1:]))
+        # shift by half a step so the uniform is never exactly 0 (which would give -inf)
+        return ndtri((self._raw(1, first*per, shape[0]*per) + 0.5)*2.0**-53).reshape(shape)
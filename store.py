@@ -0,0 +1,234 @@
+import json
+import os
+import numpy as np
+from module import simulate_batch, find_p_values
+from seeding import WormStreams
+
+
+class ResultStore():
+    """ Keeps the results of many simulated replicates on disk, as shards of ".npy" files listed in an index.
+    Each shard holds the replicates of one batch: their one-tailed p values, their bin counts (stored as the smallest
+    unsigned integer type that fits, since densities are counts/size) and the counting times. Shards are loaded
+    memory-mapped, so reading a campaign never needs all of it in RAM. Only one process should append at a time.
+
+    Instance Attributes
+    -------------------
+    path : a string
+        The folder of the store. It holds "index.jsonl" (one JSON line per shard) and the shard files.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, shard, name):
+        return os.path.join(self.path, "shard_" + str(shard).zfill(6) + "_" + name + ".npy")
+
+    def _save(self, path, array):
+        # write to a temporary file first so an interrupted append never leaves a broken shard
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, array)
+        os.replace(path + ".tmp", path)
+
+    def append(self, params, mid_bin, counts, p_values, first=0):
+        """ Add a batch of replicates to the store as a new shard.
+
+        Parameters
+        ----------
+        params : a dictionary
+            The parameters of the batch (e.g. {"hour": 1, "spread": 8, "size": 50, "diff": 1, "seed": 0}),
+            used to find it again. The values must be numbers, strings, booleans or None.
+        mid_bin : a list of integers or floats
+            The counting times of the batch.
+        counts : a numpy array of integers with shape (reps, groups, len(mid_bin))
+            The number of worms of each treatment group of each replicate counted in each bin.
+        p_values : a numpy array of floats with shape (reps, groups - 1)
+            The one-tailed p values of each replicate.
+        first : an int (default value = 0)
+            The number of the first replicate of the batch.
+
+        Returns
+        -------
+        entry : a dictionary
+            The line added to the index.
+        """
+
+        counts = np.asarray(counts)
+        p_values = np.asarray(p_values, dtype=float)
+        shard = len(self.index())
+        # bin counts are small whole numbers, so the smallest type that fits keeps the shards compact
+        dtype = np.min_scalar_type(max(int(counts.max(initial=0)), 0))
+
+        self._save(self._file(shard, "counts"), counts.astype(dtype))
+        self._save(self._file(shard, "p_values"), p_values)
+        self._save(self._file(shard, "mid_bin"), np.asarray(mid_bin, dtype=float))
+
+        entry = {"shard": shard, "params": dict(params), "first": int(first), "reps": int(counts.shape[0]),
+                 "groups": int(counts.shape[1]), "bins": int(counts.shape[2]), "dtype": str(dtype)}
+        # the index line is written last, so a shard is only listed once all of its files exist
+        with open(os.path.join(self.path, "index.jsonl"), "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+        return entry
+
+    def index(self, **where):
+        """ List the shards whose parameters match every filter.
+
+        Parameters
+        ----------
+        where : keyword arguments (e.g. spread=8, size=[50, 100], diff=lambda d: d > 0.5)
+            A value keeps the shards with that value, a list keeps the shards with any of its values,
+            and a function keeps the shards for which it returns True.
+
+        Returns
+        -------
+        entries : a list of dictionaries
+            The index lines of the matching shards, in the order they were added.
+        """
+
+        path = os.path.join(self.path, "index.jsonl")
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+
+        def match(params):
+            for key, value in where.items():
+                if key not in params:
+                    return False
+                if callable(value):
+                    if not value(params[key]):
+                        return False
+                elif isinstance(value, (list, tuple, set)):
+                    if params[key] not in value:
+                        return False
+                elif params[key] != value:
+                    return False
+            return True
+
+        return [i for i in entries if match(i["params"])]
+
+    def table(self, **where):
+        """ Return the matching shards as a pandas DataFrame, with one column for each parameter. """
+        import pandas as pd
+
+        rows = [dict(i["params"], shard=i["shard"], first=i["first"], reps=i["reps"]) for i in self.index(**where)]
+        return pd.DataFrame(rows)
+
+    def counts(self, shard):
+        """ Load the bin counts of a shard, memory-mapped, with shape (reps, groups, bins). """
+
+        return np.load(self._file(shard, "counts"), mmap_mode="r")
+
+    def mid_bin(self, shard):
+        """ Load the counting times of a shard. """
+
+        return np.load(self._file(shard, "mid_bin")).tolist()
+
+    def densities(self, shard, rows=slice(None)):
+        """ Find the fraction of worms molting at each time for some replicates of a shard.
+
+        Parameters
+        ----------
+        shard : an int
+            The number of the shard.
+        rows : a slice, an int or a list of ints (default value = every replicate)
+            The replicates of the shard to read. Only these rows are read from disk.
+
+        Returns
+        -------
+        densities : a numpy array of floats with shape (..., groups, bins)
+        """
+
+        size = self.index_entry(shard)["params"].get("size")
+        if size is None:
+            raise ValueError("the parameters of shard " + str(shard) + " have no size")
+
+        return np.asarray(self.counts(shard)[rows], dtype=float)/size
+
+    def index_entry(self, shard):
+        """ Return the index line of a shard. """
+
+        for i in self.index():
+            if i["shard"] == shard:
+                return i
+        raise KeyError(shard)
+
+    def p_values(self, **where):
+        """ Read the p values of every matching shard, without reading any bin counts.
+        The matching shards must have the same treatment groups, so each column is the same pair of groups.
+
+        Parameters
+        ----------
+        where : keyword arguments
+            The filters on the parameters (see index).
+
+        Returns
+        -------
+        p_values : a numpy array of floats with shape (reps, groups - 1)
+            The p values of the matching shards, one after the other in the order of index(**where),
+            so table(**where) gives the parameters of each block of reps rows.
+        """
+
+        entries = self.index(**where)
+        if not entries:
+            return np.empty((0, 0))
+        groups = {(i["groups"], i["params"].get("groups")) for i in entries}
+        if len(groups) > 1:
+            raise ValueError("the matching shards have different treatment groups, so their p values cannot be "
+                             "stacked (filter them by their parameters first)")
+
+        return np.concatenate([np.load(self._file(i["shard"], "p_values"), mmap_mode="r") for i in entries])
+
+
+def simulate_to_store(store, hour=1, spread=8, size=50, diff=1, reps=1000, seed=0, chunk=None, first=0, groups=None):
+    """ Simulate replicates in chunks and append each chunk to a store, so a campaign never has to fit in memory.
+    The replicates are the same as batch_p_values gives for the same seed and first replicate.
+
+    Parameters
+    ----------
+    store : an object of the class ResultStore or a string
+        The store (or the folder of the store) to append to.
+    hour : an int or a float (default value = 1)
+        This represents the frequency that data are collected. (ie worms counted ____ times per hour)
+    spread : an int or a float (default value = 8)
+        Used to controll the variance in starting age of the worm. If the spread is small, worms will be roughly the same age.
+    size : an int (default value = 50)
+        The number of worms in each treatment group.
+    diff : an int or a float (default value = 1)
+        The difference in means between treatment groups. (UNKNOWN in real life)
+    reps : an int (default value = 1000)
+        The number of replicates to simulate.
+    seed : an int (default value = 0)
+        The master seed, saved with each shard.
+    chunk : None or an int (default value = None)
+        The number of replicates in each shard. None keeps each chunk to about 2 million worms.
+    first : an int (default value = 0)
+        The number of the first replicate, so a campaign can be extended later with new replicates.
+    groups : None or a list (default value = None)
+        The food concentrations of the treatment groups (see module.group_means). A list is saved with each shard.
+
+    Returns
+    -------
+    entries : a list of dictionaries
+        The index lines of the new shards.
+    """
+
+    if not isinstance(store, ResultStore):
+        store = ResultStore(store)
+    streams = WormStreams(seed)
+    n_groups = 4 if groups is None else len(groups)
+    if chunk is None:
+        chunk = max(1, 2000000//(n_groups*size))
+
+    params = {"hour": hour, "spread": spread, "size": size, "diff": diff, "seed": seed}
+    if groups is not None:
+        params["groups"] = json.dumps(groups if isinstance(groups, dict) else list(groups))
+
+    entries = []
+    for start in range(0, reps, chunk):
+        n = min(chunk, reps - start)
+        mid_bin, counts = simulate_batch(hour, spread, size, diff, n, streams, first + start, groups)
+        entries.append(store.append(params, mid_bin, counts, find_p_values(mid_bin, counts), first + start))
+
+    return entries
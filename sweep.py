@@ -0,0 +1,190 @@
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import numpy as np
+from module import ENGINE_VERSION
+from power import PAIRS, pair_names, power_p_values
+
+
+# the parameters of module.run that can be swept, in the order they appear in the results
+PARAMETERS = ["hour", "spread", "size", "diff"]
+
+
+def make_grid(grid):
+    """ List every combination of parameter values in a grid spec.
+
+    Parameters
+    ----------
+    grid : a dictionary of lists (e.g. {"hour": [0.5, 1], "spread": [2, 8], "size": [50], "diff": [1]})
+        The values to try for each parameter in PARAMETERS. A single value can be given instead of a list.
+
+    Returns
+    -------
+    points : a list of dictionaries
+        One dictionary of parameter values for each point in the grid.
+    """
+
+    missing = [i for i in PARAMETERS if i not in grid]
+    if missing:
+        raise ValueError("grid is missing values for " + ", ".join(missing))
+
+    values = [np.atleast_1d(grid[i]).tolist() for i in PARAMETERS]
+
+    return [dict(zip(PARAMETERS, point)) for point in itertools.product(*values)]
+
+
+def point_key(point, reps, alpha, seed, groups=None):
+    """ Create the cache key of a grid point from its parameters, seed, treatment groups and ENGINE_VERSION.
+
+    Parameters
+    ----------
+    point : a dictionary
+        The value of each parameter in PARAMETERS.
+    reps : an int
+        The number of replicates run at the point.
+    alpha : a float
+        The significance threshold for the one-tailed p values.
+    seed : an int
+        The master seed of the replicates.
+    groups : None, a list or a dictionary (default value = None)
+        The food concentrations of the treatment groups (see module.group_means).
+
+    Returns
+    -------
+    key : a string
+        A short hexadecimal hash, used as the name of the cache file.
+    """
+
+    # floats are stored with repr so 1 and 1.0 give the same key
+    spec = {i: repr(float(point[i])) for i in PARAMETERS}
+    spec.update(reps=int(reps), alpha=repr(float(alpha)), seed=int(seed), engine=ENGINE_VERSION)
+    if groups is not None:
+        spec["groups"] = json.dumps(groups if isinstance(groups, dict) else list(groups))
+    text = json.dumps(spec, sort_keys=True)
+
+    return hashlib.sha1(text.encode()).hexdigest()[:20]
+
+
+def summarize_point(point, reps, alpha, seed, groups=None):
+    """ Run the replicates of one grid point and summarize the p values of each pair of treatment groups.
+
+    Parameters
+    ----------
+    point : a dictionary
+        The value of each parameter in PARAMETERS.
+    reps : an int
+        The number of replicates to run.
+    alpha : a float
+        The significance threshold for the one-tailed p values.
+    seed : an int
+        The master seed of the replicates.
+    groups : None, a list or a dictionary (default value = None)
+        The food concentrations of the treatment groups (see module.group_means). None uses the four default groups.
+
+    Returns
+    -------
+    rows : a list of dictionaries
+        One row for each pair of neighbouring groups (see power.pair_names), with the parameters, the power
+        and the mean and median p value.
+    """
+
+    p_values = power_p_values(point["hour"], point["spread"], point["size"], point["diff"],
+                              reps=reps, seed=seed, processes=1, groups=groups)
+
+    rows = []
+    for i, pair in enumerate(PAIRS if groups is None else pair_names(len(groups))):
+        # a nan p value (too few worms to test) counts as not significant and is left out of the averages
+        finite = p_values[np.isfinite(p_values[:, i]), i]
+        row = dict(point)
+        row.update(reps=reps, alpha=alpha, seed=seed, pair=pair,
+                   power=float(np.sum(finite < alpha)/reps),
+                   mean_p=float(np.mean(finite)) if len(finite) else np.nan,
+                   median_p=float(np.median(finite)) if len(finite) else np.nan)
+        rows.append(row)
+
+    return rows
+
+
+def _run_point(args):
+    # unpack the arguments in the worker process and return the key with the rows
+    key, point, reps, alpha, seed, groups = args
+    return key, summarize_point(point, reps, alpha, seed, groups)
+
+
+def run_sweep(grid, reps=1000, alpha=0.05, seed=0, cache_dir="sweep_cache", processes=None, groups=None):
+    """ Estimate the power at every point of a parameter grid, reusing points already stored in the cache.
+
+    Parameters
+    ----------
+    grid : a dictionary of lists
+        The values to try for each parameter in PARAMETERS (see make_grid).
+    reps : an int (default value = 1000)
+        The number of replicates run at each point.
+    alpha : a float (default value = 0.05)
+        The significance threshold for the one-tailed p values.
+    seed : an int (default value = 0)
+        The master seed. Every point uses the same seed, so neighbouring points share random numbers
+        and the differences between them are mostly due to the parameters.
+    cache_dir : a string or None (default value = "sweep_cache")
+        The folder where the summary of each point is saved as a JSON file. None turns off the cache.
+    processes : None or an int (default value = None)
+        The number of worker processes. None uses every core, and 1 runs everything in this process.
+    groups : None, a list or a dictionary (default value = None)
+        The food concentrations of the treatment groups (see module.group_means). None uses the four default groups.
+
+    Returns
+    -------
+    results : a pandas DataFrame
+        One row for each point and pair of treatment groups, with the columns in PARAMETERS followed by
+        "reps", "alpha", "seed", "pair", "power", "mean_p" and "median_p".
+        Use results.pivot_table(index=..., columns=..., values="power") to make a heatmap.
+    """
+
+    points = make_grid(grid)
+    keys = [point_key(point, reps, alpha, seed, groups) for point in points]
+    found = {}
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        for key in keys:
+            path = os.path.join(cache_dir, key + ".json")
+            if os.path.exists(path):
+                with open(path) as f:
+                    found[key] = json.load(f)
+
+    # only the points that are not cached are computed (each unique point once)
+    tasks = {key: (key, point, reps, alpha, seed, groups) for key, point in zip(keys, points) if key not in found}
+    tasks = list(tasks.values())
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    if processes == 1 or len(tasks) < 2:
+        results = map(_run_point, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(_run_point, tasks)
+
+    try:
+        for key, rows in results:
+            found[key] = rows
+            if cache_dir is not None:
+                # write to a temporary file first so an interrupted sweep never leaves a broken cache file
+                path = os.path.join(cache_dir, key + ".json")
+                with open(path + ".tmp", "w") as f:
+                    json.dump(rows, f)
+                os.replace(path + ".tmp", path)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    # pandas is only needed for the final table, so worker processes never import it
+    import pandas as pd
+
+    rows = [row for key in keys for row in found[key]]
+    columns = PARAMETERS + ["reps", "alpha", "seed", "pair", "power", "mean_p", "median_p"]
+
+    return pd.DataFrame(rows, columns=columns)
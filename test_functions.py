@@ -1,4 +1,25 @@
-from module import find_small, sort_worm
+from module import find_small, find_big, find_mid_bin, create_bin, sort_worm, count_worm, count_batch
+from module import create_groups, find_molt, Worm, simulate, simulate_run, find_p_values
+from module import group_means, count_groups, simulate_stream, bin_plan
+from module import molt_cdf, expected_density, simulate_analytic, simulate_batch, batch_p_values
+from seeding import WormStreams, spawn_seeds
+from freq_stats import ttest_counts
+from power import power_analysis, power_p_values, pair_names
+from sweep import run_sweep, point_key, make_grid
+import sweep
+from profiling import profile, StageRecord
+from glow import glow_counts, simulate_plate, plate_labels
+from inference import fit_experiments
+from store import ResultStore, simulate_to_store
+from resample import resample_test
+from plotting import export_archive, offscreen_figure
+from benchmark import loaded_modules, import_time, run_suite, compare
+import os
+import datetime
+import pytest
+import data_analysis
+from scipy import stats
+import numpy as np
 
 
 def test_find_small():
@@ -32,4 +53,527 @@ def test_sort_worm():
     assert sort_worm(0, test_bins, [[7.9, 11.0], [7.8, 8.7], [7.4, 9.3], [8.0, 8.1]]) == [[7.9], [7.9], [11.0], [11.0]]
     test_bins = [[5.5, 8.5], [7.0, 10.0], [8.5, 11.5]]
     assert sort_worm(2, test_bins, [[7.9], [7.8, 18.4], [7.4, 9.3], []]) == [[7.4], [7.4, 9.3], [9.3]]
-    assert sort_worm(2, test_bins, [[7.9, 11.0], [7.8, 8.7], [], [8.0]]) == [[], [], []]
\ No newline at end of file
+    assert sort_worm(2, test_bins, [[7.9, 11.0], [7.8, 8.7], [], [8.0]]) == [[], [], []]
+    # the worms of each bin keep the order they were given in
+    assert sort_worm(0, test_bins, [[9.3, 7.4, 8.0]]) == [[7.4, 8.0], [9.3, 7.4, 8.0], [9.3]]
+
+
+def test_create_groups():
+    """ Tests create_groups and find_molt functions """
+    
+    # first parameter : an int or a float (spread)
+    # second parameter : an int or a float (diff)
+    # third parameter : an int (size)
+    # return : a Cohort that still indexes like a list of four lists of worm objects
+    worms = create_groups(8, 1, 20000, rng=0)
+    assert len(worms) == 4
+    assert isinstance(worms[0][0], Worm)
+    assert len(list(worms)) == 4 and worms[-1] is worms[3] and worms[3][5].age == worms.age[3*20000 + 5]
+    with pytest.raises(IndexError):
+        worms[4]
+    
+    # the same seed should give the same worms
+    assert np.array_equal(create_groups(8, 1, 10, rng=3).age, create_groups(8, 1, 10, rng=3).age)
+    
+    # molt times should match the per-worm model: mean + group*diff - spread/2 on average
+    molt = find_molt(20000, worms)
+    assert len(molt) == 4 and len(molt[3]) == 20000
+    for i in range(4):
+        assert abs(np.mean(molt[i]) - (15 + i - 4)) < 0.1
+        assert abs(np.std(molt[i]) - np.sqrt(4 + 64/12)) < 0.1
+    
+    # legacy lists of worm objects should give the same molt times as the cohort
+    legacy = [worms[i] for i in range(4)]
+    assert np.allclose(find_molt(20000, legacy)[2], molt[2])
+
+
+def test_count_worm():
+    """ Tests count_worm function """
+    
+    # the counts should be the lengths of the lists from sort_worm
+    test_bins = [[5.5, 8.5], [7.0, 10.0], [8.5, 11.5], [10.0, 13.0]]
+    molt = [[7.9, 11.0, 8.5, 10.0], [7.8, 8.7], [7.4, 9.3], [8.0, 8.1]]
+    assert count_worm(0, test_bins, molt).tolist() == [1, 2, 3, 2]
+    assert count_worm(0, test_bins, molt).tolist() == [len(i) for i in sort_worm(0, test_bins, molt)]
+    
+    # the slices should cut the sorted molt times at the edges of each bin
+    counts, sorted_molt, bin_slices = count_worm(0, test_bins, molt, slices=True)
+    assert sorted_molt[bin_slices[2]].tolist() == [8.5, 10.0, 11.0]
+    assert count_worm(3, test_bins, [[], [], [], []]).tolist() == [0, 0, 0, 0]
+
+
+def test_groups():
+    """ Tests group_means and count_groups functions with more than four treatment groups """
+    
+    # groups : a list of concentrations spaced by diff, or a dictionary of concentration -> mean molt age
+    # returns : one density curve per group and one p value per neighbouring pair
+    labels, means = group_means(1, None)
+    assert labels == ["6 mg/mL", "4.8 mg/mL", "3.6 mg/mL", "2.4 mg/mL"] and means.tolist() == [15, 16, 17, 18]
+    dose = {c: 15 + 8/c for c in [1, 1.5, 2, 3, 4, 6, 8, 12, 16, 24, 32, 48]}
+    result = simulate_run(1, 8, 40, 1, seed=5, groups=dose)
+    assert result.densities.shape == (12, len(result.mid_bin)) and result.p_values.shape == (11,)
+    assert result.labels == list(dose)
+    assert simulate_run(1, 8, 40, 1, seed=5, method="analytic", groups=dose).p_values.shape == (11,)
+    assert batch_p_values(1, 8, 40, 1, 3, rng=5, groups=dose).shape == (3, 11)
+    assert pair_names(12)[-1] == "10-11"
+    # the default groups give the same worms as naming them explicitly
+    assert np.array_equal(simulate(1, 8, 40, 1, rng=5)[1], simulate(1, 8, 40, 1, rng=5, groups=["a", "b", "c", "d"])[1])
+    assert Worm("4.8 mg/mL", 0, 1, rng=0).molt_age == Worm("b", 0, 1, rng=0, groups={"a": 15, "b": 16}).molt_age
+    with pytest.raises(ValueError):
+        Worm("1 mg/mL", 8, 1)
+    # ragged groups are counted the same as one at a time
+    molt = [[7.9, 11.0, 8.5, 10.0], [7.8, 8.7], [], [8.0, 8.1, 30.0]]
+    bins = create_bin(find_mid_bin(7, 11, 0.5))
+    assert np.array_equal(count_groups(bins, molt), [count_worm(i, bins, molt) for i in range(4)])
+
+
+def test_ttest_counts():
+    """ Tests ttest_counts function """
+    
+    # (value, count) pairs should give the same p value as ttest_ind on the repeated values
+    values = [7.0, 8.0, 9.0, 10.0, 11.0]
+    counts_1 = [3, 10, 4, 0, 1]
+    counts_2 = [0, 2, 9, 7, 5]
+    flat_1 = np.repeat(values, counts_1)
+    flat_2 = np.repeat(values, counts_2)
+    assert np.isclose(ttest_counts(values, counts_1, values, counts_2)[1], stats.ttest_ind(flat_1, flat_2)[1])
+    assert np.isclose(ttest_counts(values, counts_1, values, counts_2, equal_var=False)[1],
+                      stats.ttest_ind(flat_1, flat_2, equal_var=False)[1])
+    
+    # extra leading dimensions are separate comparisons
+    p = ttest_counts(values, [counts_1, counts_2], values, [counts_2, counts_1])[1]
+    assert p.shape == (2,) and np.isclose(p[0], p[1])
+
+
+def test_power_analysis():
+    """ Tests power_analysis function """
+    
+    # return : one rejection rate between 0 and 1 for each neighbouring pair of groups
+    power = power_analysis(hour=1, spread=8, size=50, diff=1, reps=20, seed=4, processes=1)
+    assert power.shape == (3,)
+    assert np.all((power >= 0) & (power <= 1))
+    
+    # each replicate has its own seed, so the number of processes does not change the results
+    assert np.array_equal(power_p_values(reps=600, seed=4, processes=1), power_p_values(reps=600, seed=4, processes=2))
+    
+    # a huge difference between groups should always be significant
+    assert np.all(power_analysis(diff=10, reps=5, seed=1, processes=1) == 1)
+
+
+def test_run_sweep(tmp_path, monkeypatch):
+    """ Tests run_sweep function """
+    
+    # return : a tidy DataFrame with one row per grid point and pair of treatment groups
+    grid = {"hour": [0.5, 1], "spread": 8, "size": 30, "diff": [1]}
+    results = run_sweep(grid, reps=5, cache_dir=str(tmp_path), processes=1)
+    assert len(results) == 2*3
+    assert list(results["pair"][:3]) == ["0-1", "1-2", "2-3"]
+    assert len(os.listdir(tmp_path)) == 2
+    
+    # extending the grid only computes the new point, and cached points give the same results
+    grid["hour"] = [0.5, 1, 2]
+    extended = run_sweep(grid, reps=5, cache_dir=str(tmp_path), processes=1)
+    assert len(os.listdir(tmp_path)) == 3
+    assert extended["power"][:6].tolist() == results["power"].tolist()
+    
+    # other treatment groups or another version of the random numbers are cached separately
+    assert point_key(make_grid(grid)[0], 5, 0.05, 0) != point_key(make_grid(grid)[0], 5, 0.05, 0, groups=[6, 3])
+    monkeypatch.setattr(sweep, "ENGINE_VERSION", sweep.ENGINE_VERSION + 1)
+    run_sweep(grid, reps=5, cache_dir=str(tmp_path), processes=1)
+    assert len(os.listdir(tmp_path)) == 6
+    assert len(run_sweep({"hour": 1, "spread": 8, "size": 30, "diff": 1}, reps=5, cache_dir=None, processes=1,
+                         groups=[6, 3])) == 1
+
+
+def test_count_batch():
+    """ Tests count_batch function """
+    
+    # first parameter : an array of molt times with shape (reps, groups, size)
+    # second parameter : an int or a float
+    # return : the common mid_bin and the counts with shape (reps, groups, len(mid_bin))
+    molt = np.random.default_rng(2).normal(14, 3, (20, 4, 30))
+    for hour in [1, 0.5, 0.1]:
+        mid_bin, counts = count_batch(molt, hour)
+        assert counts.shape == (20, 4, len(mid_bin))
+        
+        # each replicate should match the counts of the step by step functions, with zeros outside its own bins
+        for r in range(20):
+            small = find_small(list(molt[r]), hour)
+            bins = create_bin(find_mid_bin(small, find_big(list(molt[r]), hour), hour))
+            expected = np.array([count_worm(i, bins, molt[r]) for i in range(4)])
+            start = int(round(small/hour - mid_bin[0]/hour))
+            assert np.array_equal(counts[r][:, start:start + len(bins)], expected)
+            assert counts[r].sum() == expected.sum()
+
+
+def test_simulate_run():
+    """ Tests simulate_run function """
+    
+    # return : a RunResult with the same counts as simulate, without printing or plotting
+    result = simulate_run(hour=0.5, spread=8, size=40, diff=1, seed=7)
+    mid_bin, counts = simulate(0.5, 8, 40, 1, rng=7)
+    assert result.mid_bin == mid_bin
+    assert np.allclose(result.densities, counts/40)
+    assert np.allclose(result.p_values, find_p_values(mid_bin, counts))
+    assert result.n.tolist() == counts.sum(axis=1).tolist()
+    assert np.allclose(result.mean[0], np.sum(np.array(mid_bin)*counts[0])/counts[0].sum())
+
+
+def test_bin_plan():
+    """ Tests bin_plan function and BinPlan class """
+    
+    # parameters : hour, then the first and last counting times as whole numbers of hour
+    # returns : the same plan for the same key, with the bins and counts of the step by step functions
+    plan = bin_plan(0.5, 14, 22)
+    assert bin_plan(0.5, 14, 22) is plan
+    assert plan.mid_bin() == find_mid_bin(7, 11, 0.5) and plan.bins() == create_bin(find_mid_bin(7, 11, 0.5))
+    molt = [[7.9, 11.0, 8.5, 10.0], [7.8, 8.7], [7.4, 9.3], [8.0, 8.1]]
+    assert np.array_equal(plan.count(molt), count_groups(plan.bins(), molt))
+    assert np.array_equal(plan.count(molt, 16, 18), count_groups(create_bin([8, 8.5, 9]), molt))
+    assert plan.mid_bin(16, 18) == [8, 8.5, 9]
+
+
+def test_simulate_stream():
+    """ Tests simulate_stream function """
+    
+    # chunk : the number of worms created at once
+    # return : the same mid_bin and counts as simulate, and the number, mean and variance of the molt times
+    for hour in [1, 0.1]:
+        mid_bin, counts = simulate(hour, 8, 200, 1, rng=3)
+        stream = simulate_stream(hour, 8, 200, 1, rng=3, chunk=77)
+        assert np.allclose(stream[0], mid_bin) and np.array_equal(stream[1], counts)
+    molt = find_molt(200, create_groups(8, 1, 200, rng=3))
+    n, mean, var = stream[2]
+    assert n.tolist() == [200]*4
+    assert np.allclose(mean, np.mean(molt, axis=1)) and np.allclose(var, np.var(molt, axis=1, ddof=1))
+    assert np.array_equal(simulate_run(1, 8, 200, 1, seed=3, method="stream").p_values, simulate_run(1, 8, 200, 1, seed=3).p_values)
+
+
+def test_glow_counts():
+    """ Tests glow_counts and simulate_plate functions """
+    
+    # first parameter : an uneven schedule of hours since the start
+    # returns : the worms of each well glowing at each time, counted one worm at a time as a check
+    times = [0.0, 0.4, 2.0, 2.1, 7.5, 12.0, 13.0, 20.0]
+    means, worm_num = np.array([10.0, 12.0, 14.0]), np.array([30, 5, 12])
+    counts = glow_counts(times, means, worm_num, 8, rng=9, glow=(1.0, 2.0))
+    rng = np.random.default_rng(9)
+    well = np.repeat(np.arange(3), worm_num)
+    age = rng.uniform(0, 8, len(well))
+    molt = rng.normal(means[well], 2) - age
+    for w in range(3):
+        assert counts[w].tolist() == [np.sum((molt[well == w] - 1 <= t) & (t < molt[well == w] + 2)) for t in times]
+    
+    # expected counts are the average of many random plates
+    expected = glow_counts(times, means, worm_num, 8, expected=True)
+    average = np.mean([glow_counts(times, means, worm_num, 8, rng=i) for i in range(400)], axis=0)
+    assert counts.shape == expected.shape == (3, 8)
+    assert np.allclose(average, expected, atol=0.6)
+    
+    # the simulated spreadsheet works with the lab analysis functions
+    import pandas as pd
+    setup = pd.DataFrame({"well_num": plate_labels(3), "worm_num": [20, 25, 30], "e_coli": [100, 200, 300]})
+    data = simulate_plate(["9:00", "9:40", datetime.time(10, 15), 12.5], setup, lambda conc: 3 - conc/10, rng=0)
+    assert list(data.columns) == ["time", "A1", "A2", "A3"]
+    assert np.allclose(data["time"], [9, 9 + 40/60, 10.25, 12.5])
+    assert np.allclose(data_analysis.find_wells(data, setup)[1], [5, 8, 10])
+
+
+def test_fit_experiments(tmp_path):
+    """ Tests fit_experiments function """
+    
+    # first parameter : the experiments to fit, here a plate simulated with diff = 2 and spread = 5
+    # returns : the log likelihood of each pair of diff and spread, highest at the true values
+    pytest.importorskip("openpyxl")
+    import pandas as pd
+    rng = np.random.default_rng(0)
+    setup = pd.DataFrame({"well_num": plate_labels(24), "worm_num": rng.integers(80, 120, 24),
+                          "e_coli": rng.integers(100, 1000, 24)})
+    conc = setup["e_coli"].to_numpy()/setup["worm_num"].to_numpy()
+    schedule = [datetime.time(9 + i//2, 30*(i % 2)) for i in range(30)]
+    data = simulate_plate(schedule, setup, lambda c: 6 + 2*(c.max() - c)/((c.max() - c.min())/3), spread=5, rng=1)
+    data["time"] = schedule
+    data.to_excel(tmp_path / "exp_1_data.xlsx", index=False)
+    setup.to_excel(tmp_path / "exp_1_setup.xlsx", index=False)
+    
+    fit = fit_experiments(["exp_1"], diffs=[1, 2, 3], spreads=[2, 5, 8], data_dir=tmp_path, processes=1)
+    assert len(fit) == 9
+    assert fit.loc[fit["loglik"].idxmax(), ["diff", "spread"]].tolist() == [2, 5]
+    # the second fit reads the cached spreads, and only computes the new one
+    again = fit_experiments(["exp_1"], diffs=[1, 2, 3], spreads=[5, 11], data_dir=tmp_path, processes=1)
+    assert np.array_equal(again["loglik"][again["spread"] == 5], fit["loglik"][fit["spread"] == 5])
+
+
+def test_result_store(tmp_path):
+    """ Tests ResultStore class and simulate_to_store function """
+    
+    # chunk : the number of replicates in each shard
+    # returns : the same p values as batch_p_values, read back by parameter values without loading the counts
+    store = ResultStore(tmp_path / "campaign")
+    simulate_to_store(store, 1, 8, 40, 1, reps=25, seed=3, chunk=10)
+    simulate_to_store(store, 1, 4, 40, 1, reps=5, seed=3)
+    assert [i["reps"] for i in store.index()] == [10, 10, 5, 5]
+    assert np.array_equal(store.p_values(spread=8), batch_p_values(1, 8, 40, 1, 25, rng=3), equal_nan=True)
+    assert len(store.p_values(spread=[4, 8])) == 30 and len(store.index(spread=lambda s: s < 8)) == 1
+    assert store.p_values(spread=2).shape == (0, 0)
+    
+    # the counts are memory-mapped, and densities only read the rows asked for
+    counts = store.counts(1)
+    assert isinstance(counts, np.memmap) and counts.dtype == np.uint8
+    mid_bin, expected = simulate_batch(1, 8, 40, 1, 10, rng=3, first=10)
+    assert store.mid_bin(1) == mid_bin and np.array_equal(counts, expected)
+    assert np.allclose(store.densities(1, [0, 4]), expected[[0, 4]]/40)
+    assert store.table(spread=8)["first"].tolist() == [0, 10, 20]
+    
+    # the p values of shards with different treatment groups are not stacked
+    simulate_to_store(store, 1, 8, 40, 1, reps=5, seed=3, groups=[6, 3])
+    assert store.p_values(spread=8, groups="[6, 3]").shape == (5, 1)
+    with pytest.raises(ValueError):
+        store.p_values(spread=8)
+
+
+def test_startup():
+    """ Tests that importing the files has no side effects and does not load heavy packages """
+    
+    # worker processes import these files, so scipy.stats, pandas and matplotlib should wait until they are used
+    for name in ["module", "power", "sweep", "data_analysis", "profiling", "glow", "inference", "store", "resample",
+                 "plotting"]:
+        assert loaded_modules(name) == []
+    assert 0 < import_time("module", repeat=1) < 5
+
+
+def test_benchmark_suite():
+    """ Tests run_suite and compare functions """
+    
+    # match : only the benchmarks with this text in their name
+    # returns : the time of each benchmark, and the ones more than 25% slower than the baseline
+    times = run_suite("find_molt", quick=True, repeat=1)
+    assert list(times) == ["find_molt[size=1000]"]
+    assert times["find_molt[size=1000]"] > 0
+    assert compare({"a": 1.0, "b": 2.0, "c": 1.0}, {"a": 1.0, "b": 1.0}) == {"b": 2.0}
+
+
+def test_profile(tmp_path):
+    """ Tests profile function and StageRecord class """
+    
+    # memory : if True, the peak memory of each stage is traced too
+    # returns : the calls, seconds and memory of each stage, which add up across runs and save as JSON
+    with profile(memory=True) as record:
+        simulate_run(1, 8, 50, 1, seed=0)
+        simulate_run(1, 8, 50, 1, seed=1)
+    assert list(record.stages) == ["create_groups", "find_molt", "binning", "count_worm", "t_tests"]
+    assert record.stages["t_tests"]["calls"] == 2
+    assert record.stages["create_groups"]["peak_bytes"] > 0
+    assert record.stages["create_groups"]["net_blocks"] > 0
+    record.dump(tmp_path / "profile.json")
+    total = StageRecord.load(tmp_path / "profile.json").merge(record)
+    assert total.stages["binning"]["calls"] == 4
+    # nothing is recorded outside of the with block
+    simulate_run(1, 8, 50, 1, seed=0)
+    assert record.stages["t_tests"]["calls"] == 2
+
+
+def write_experiment(folder, exp, counts, worm_num, e_coli):
+    """ Write a small experiment in the same Excel format as the lab data """
+    
+    import pandas as pd
+    data = pd.DataFrame(counts, columns=["A" + str(i + 1) for i in range(len(worm_num))])
+    data.insert(0, "time", [datetime.time(9 + i//2, 30*(i % 2)) for i in range(len(counts))])
+    data.to_excel(os.path.join(folder, exp + "_data.xlsx"), index=False)
+    setup = pd.DataFrame({"well_num": list(data.columns[1:]), "worm_num": worm_num, "e_coli": e_coli})
+    setup.to_excel(os.path.join(folder, exp + "_setup.xlsx"), index=False)
+
+
+def test_load_experiment(tmp_path, monkeypatch):
+    """ Tests load_experiment function """
+    
+    pytest.importorskip("openpyxl")
+    import pandas as pd
+    write_experiment(tmp_path, "exp_1", [[0, 1, 0], [2, 3, 0], [1, 0, 4]], [10, 12, 9], [40, 60, 20])
+    
+    # return : the counts with the time in hours, and the setup table
+    data, setup = data_analysis.load_experiment("exp_1", str(tmp_path))
+    assert data["time"].tolist() == [9.0, 9.5, 10.0]
+    assert data["A2"].tolist() == [1, 3, 0]
+    assert setup["e_coli"].tolist() == [40, 60, 20]
+    
+    # the second time, the cache is used without parsing the workbooks
+    with monkeypatch.context() as m:
+        m.setattr(pd, "read_excel", None)
+        cached, cached_setup = data_analysis.load_experiment("exp_1", str(tmp_path))
+    assert cached.equals(data) and cached_setup.equals(setup)
+    
+    # changing a workbook makes the cache parse it again
+    write_experiment(tmp_path, "exp_1", [[0, 1, 0], [2, 5, 0], [1, 0, 4]], [10, 12, 9], [40, 60, 20])
+    assert data_analysis.load_experiment("exp_1", str(tmp_path))[0]["A2"].tolist() == [1, 5, 0]
+
+
+def test_find_wells():
+    """ Tests find_wells and find_outliers functions """
+    
+    import pandas as pd
+    data = pd.DataFrame({"time": [9.0, 9.5, 10.0], "A1": [0, 4, 1], "A2": [0, 0, 0], "A3": [2, 13, 3], "B1": [1, 1, 0]})
+    setup = pd.DataFrame({"well_num": ["B1", "A3", "A2", "A1"], "worm_num": [8, 12, 10, 9], "e_coli": [400, 60, 20, 80]})
+    
+    # the results should be the same as joining the setup to each well one at a time
+    groups, conc, counts, fraction = data_analysis.find_wells(data, setup)
+    assert groups.tolist() == ["A1", "A3", "B1"]
+    for j, i in enumerate(groups):
+        row = setup[setup["well_num"]==i].iloc[0]
+        total = max([int(row["worm_num"]), max(data[i])])
+        assert conc[j] == int(row["e_coli"])/total
+        assert fraction[:, j].tolist() == (data[i]/total).tolist()
+    
+    # the well with 50 E. coli per worm is far from the others
+    assert data_analysis.find_outliers(np.array([6.0, 6.5, 7.0, 5.5, 50.0])).tolist() == [True]*4 + [False]
+
+
+def test_pair_table():
+    """ Tests pair_table function """
+    
+    times = np.array([0.0, 0.5, 1.0, 1.5])
+    counts = np.array([[3, 0, 1], [4, 1, 0], [1, 5, 0], [0, 2, 0]])
+    pairs = data_analysis.pair_table(np.array(["A1", "A2", "A3"]), np.array([1.0, 2.0, 4.0]), times, counts)
+    
+    # return : one row per pair of wells with the differences and the p value
+    assert pairs[["well_a", "well_b"]].values.tolist() == [["A1", "A2"], ["A1", "A3"], ["A2", "A3"]]
+    assert pairs["d_conc"].tolist() == [1.0, 3.0, 2.0]
+    p = stats.ttest_ind(np.repeat(times, counts[:, 0]), np.repeat(times, counts[:, 1]))[1]
+    assert np.isclose(pairs["p"][0], p)
+    assert np.isclose(pairs["d_mean"][0], np.mean(np.repeat(times, counts[:, 1])) - np.mean(np.repeat(times, counts[:, 0])))
+    
+    # a well with only one worm counted cannot be tested
+    assert np.isnan(pairs["p"][1]) and np.isnan(pairs["p"][2])
+
+
+def test_resample_test():
+    """ Tests resample_test function """
+    
+    values = np.arange(10.0)
+    counts_1 = np.array([0, 2, 6, 9, 7, 4, 2, 0, 0, 0])
+    counts_2 = np.array([0, 0, 1, 3, 6, 8, 7, 3, 1, 1])
+    t, p = ttest_counts(values, counts_1, values, counts_2)
+    
+    # returns : the observed t statistic, and p values close to the t test for both ways of resampling
+    for method in ["permutation", "bootstrap"]:
+        found = resample_test(values, counts_1, counts_2, method, 20000, seed=0, chunk=5000)
+        assert np.isclose(found[0], t)
+        assert abs(found[1] - p) < 0.01
+        # the chunks have their own seeds, so a worker pool gives the same p value
+        assert resample_test(values, counts_1, counts_2, method, 20000, seed=0, chunk=5000, processes=2) == found
+    
+    # the observed split is counted as a resample, so p is never 0, and one-sided tests follow the sign of t
+    assert resample_test(values, counts_1*10, counts_2*10, resamples=99, seed=1)[1] == 0.01
+    assert resample_test(values, counts_1, counts_2, resamples=999, alternative="greater", seed=1)[1] > 0.99
+    assert np.isnan(resample_test(values, counts_1, np.eye(10)[3], seed=1)[1])
+    with pytest.raises(ValueError):
+        resample_test(values, counts_1 + 0.5, counts_2)
+
+
+def test_live_experiment(tmp_path):
+    """ Tests LiveExperiment class """
+    
+    # the counts arrive in an append log, two rows and then the rest (the last line is still being written)
+    # returns : only the new rows are read, and the t tests match analyze_experiment on the whole experiment
+    pytest.importorskip("openpyxl")
+    counts = [[0, 1, 0], [2, 3, 0], [1, 0, 4], [0, 2, 6], [0, 0, 3]]
+    write_experiment(tmp_path, "exp_1", counts, [10, 12, 9], [40, 60, 20])
+    live = data_analysis.LiveExperiment("exp_1", tmp_path)
+    assert len(live.significant()) == 0 and live.curves()[1].shape == (0, 0)
+    live.plot()
+    log = tmp_path / "exp_1_data.csv"
+    log.write_text("time,A1,A2,A3\n9:00,0,1,0\n9:30,2,3,0\n")
+    assert live.update() == 2 and live.update() == 0
+    with open(log, "a") as f:
+        f.write("10:00,1,0,4\n10:30,0,2,6\n11:00,0,0,3\n11:30,0,")
+    assert live.update() == 3
+    expected = data_analysis.analyze_experiment("exp_1", tmp_path, alpha=1)
+    assert np.allclose(live.pair_table()["p"], expected["p"])
+    assert np.allclose(live.curves()[1], np.array(counts)/[10, 12, 9])
+
+
+def test_export_archive(tmp_path):
+    """ Tests export_archive function and the plots it draws """
+    
+    pytest.importorskip("openpyxl")
+    counts = [[0, 1, 0, 2], [2, 3, 0, 5], [1, 0, 4, 1], [0, 2, 6, 0], [0, 0, 3, 0]]
+    write_experiment(tmp_path, "exp_1", counts, [10, 12, 9, 11], [40, 60, 20, 30])
+    write_experiment(tmp_path, "exp_2", counts[::-1], [10, 12, 9, 11], [40, 60, 20, 30])
+    
+    # returns : one graph per experiment and the stats_test plot, saved without opening a window
+    paths = export_archive(["exp_1", "exp_2"], tmp_path / "figures", tmp_path, form="svg")
+    assert [os.path.basename(i) for i in paths] == ["exp_1_graph.svg", "exp_2_graph.svg", "stats_test.svg"]
+    assert all(os.path.getsize(i) > 0 for i in paths)
+    
+    # the wells are drawn as one collection of lines and one scatter of points, not one line per well
+    fig, ax = offscreen_figure()
+    data_analysis.make_graph("exp_1", tmp_path, ax=ax)
+    assert len(ax.collections) == 2 and len(ax.lines) == 0
+    assert len(ax.collections[0].get_segments()) == 4 and len(ax.get_legend().get_texts()) == 4
+    
+    # the live plot replaces the data of the same collections when it is drawn again
+    live = data_analysis.LiveExperiment("exp_1", tmp_path)
+    live.add_rows([9.0, 9.5], np.array(counts[:2]), ["A1", "A2", "A3", "A4"])
+    live.plot(ax=ax)
+    lines = ax.collections[-2]
+    live.add_rows([10.0, 10.5, 11.0], np.array(counts[2:]))
+    live.plot(ax=ax)
+    assert ax.collections[-2] is lines and lines.get_segments()[0].shape == (5, 2)
+
+
+def test_pair_aggregator():
+    """ Tests PairAggregator class """
+    
+    rng = np.random.default_rng(5)
+    x = rng.normal(0, 3, 50)
+    y = 0.5*x + rng.normal(0, 1, 50)
+    
+    # adding the points in batches should give the same totals as fitting them all at once
+    totals = data_analysis.PairAggregator()
+    for i in range(0, 50, 7):
+        totals.add(x[i:i + 7], y[i:i + 7])
+    assert np.allclose(totals.fit(), np.polyfit(x, y, 1))
+    assert totals.counts["green"] == np.sum((x > 0) & (y < 0))
+    assert totals.counts["red"] == np.sum((x > 0) & (y > 0))
+    assert sum(totals.counts.values()) == totals.n == 50
+    assert totals.x_min == x.min() and totals.x_max == x.max()
+
+
+def test_simulate_analytic():
+    """ Tests molt_cdf, expected_density and simulate_analytic functions """
+    
+    # the closed form should match the molt times of a large cohort
+    molt = find_molt(100000, create_groups(8, 1, 100000, rng=0))
+    for t in [6, 10, 13, 17]:
+        assert abs(molt_cdf(t, 15, 8) - np.mean(molt[0] <= t)) < 0.01
+        assert abs(molt_cdf(t, 18, 8) - np.mean(molt[3] <= t)) < 0.01
+    assert np.isclose(molt_cdf(15, 15, 0), 0.5)
+    
+    # return : counting times and counts with the same layout as simulate, for any size
+    mid_bin, counts = simulate_analytic(0.5, 8, 10**9, 1, rng=3)
+    assert counts.shape == (4, len(mid_bin))
+    assert np.allclose(counts/10**9, expected_density(mid_bin, 8, 1), atol=1e-3)
+    assert simulate_run(1, 8, 50, 1, seed=3, method="analytic").p_values.shape == (3,)
+
+
+def test_seeding():
+    """ Tests that a seed gives bit-identical results for any chunk size or split of replicates """
+    
+    # every replicate owns a fixed part of the streams, so drawing replicates 3 and 4 on their own gives the same numbers
+    streams = WormStreams(11)
+    assert np.array_equal(streams.normal(0, (5, 8))[3:], WormStreams(11).normal(3, (2, 8)))
+    assert np.array_equal(streams.uniform(0, (5, 8))[3:], WormStreams(11).uniform(3, (2, 8)))
+    assert len(set(s.entropy for s in spawn_seeds(11, 3))) == 1 and len(spawn_seeds(11, 3)) == 3
+    
+    # the chunk size and first replicate do not change the p values
+    p_values = batch_p_values(0.5, 8, 40, 1, 30, rng=11)
+    assert np.array_equal(p_values, batch_p_values(0.5, 8, 40, 1, 30, rng=11, chunk=4), equal_nan=True)
+    assert np.array_equal(p_values[10:], batch_p_values(0.5, 8, 40, 1, 20, rng=11, first=10), equal_nan=True)
+    
+    # the first replicate of a batch has the same worms as simulate with the same seed
+    mid_bin, counts = simulate(0.5, 8, 40, 1, rng=11)
+    assert counts.sum() == simulate_batch(0.5, 8, 40, 1, 1, rng=11)[1].sum()
+    assert np.allclose(find_p_values(mid_bin, counts), p_values[0])
+    
+    # a seeded worm is reproducible
+    assert Worm("6 mg/mL", 8, 1, rng=2).age == Worm("6 mg/mL", 8, 1, rng=2).age